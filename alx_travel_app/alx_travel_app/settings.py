@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import json
 import os
+from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -48,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'listings.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -81,15 +84,49 @@ WSGI_APPLICATION = 'alx_travel_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'HOST': os.environ.get('DB_HOSTNAME'),
-        'NAME': os.environ.get('DB_NAME'),
-        'USER': os.environ.get('DB_USERNAME'),
-        'PASSWORD': os.environ.get('DB_PASSWORD'),
-        'PORT': os.environ.get('DB_PORT'),
+# DB_ENGINE=sqlite runs against a local file (DB_NAME, default db.sqlite3) with no MySQL server,
+# e.g. for `manage.py benchmark`.
+
+if os.environ.get('DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME') or BASE_DIR / 'db.sqlite3',
+            # take the write lock when a transaction starts rather than failing to upgrade to it later
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'HOST': os.environ.get('DB_HOSTNAME'),
+            'NAME': os.environ.get('DB_NAME'),
+            'USER': os.environ.get('DB_USERNAME'),
+            'PASSWORD': os.environ.get('DB_PASSWORD'),
+            'PORT': os.environ.get('DB_PORT'),
+        }
     }
+
+
+# Caches
+# The listings cache holds catalogue responses; point LISTINGS_CACHE_BACKEND at
+# redis/memcached to share it between processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'listings': {
+        'BACKEND': os.environ.get('LISTINGS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('LISTINGS_CACHE_LOCATION', 'listings'),
+        'TIMEOUT': int(os.environ.get('LISTINGS_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            # least recently used tenth is culled when full
+            'MAX_ENTRIES': int(os.environ.get('LISTINGS_CACHE_MAX_ENTRIES', 10000)),
+            'CULL_FREQUENCY': 10,
+        },
+    },
 }
 
 
@@ -135,6 +172,74 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'listings.User'
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'listings.pagination.KeysetCursorPagination',
+    'PAGE_SIZE': 20,
+}
 CORS_ALLOW_ALL_ORIGINS = True
 
-CHAPA_SECRET_KEY=os.environ.get('CHAPA_SECRET_KEY')
\ No newline at end of file
+CHAPA_SECRET_KEY=os.environ.get('CHAPA_SECRET_KEY')
+CHAPA_BASE_URL = os.environ.get('CHAPA_BASE_URL', 'https://api.chapa.co/v1')
+CHAPA_CONNECT_TIMEOUT = float(os.environ.get('CHAPA_CONNECT_TIMEOUT', 3.05))
+CHAPA_READ_TIMEOUT = float(os.environ.get('CHAPA_READ_TIMEOUT', 10))
+CHAPA_MAX_RETRIES = int(os.environ.get('CHAPA_MAX_RETRIES', 2))
+CHAPA_POOL_SIZE = int(os.environ.get('CHAPA_POOL_SIZE', 10))
+# Connections per event loop for the async payment views; under ASGI one loop serves the whole process
+CHAPA_ASYNC_POOL_SIZE = int(os.environ.get('CHAPA_ASYNC_POOL_SIZE', 100))
+CHAPA_WEBHOOK_SECRET = os.environ.get('CHAPA_WEBHOOK_SECRET')
+
+# 'chapa' talks to CHAPA_BASE_URL; 'simulator' is an in-process Chapa stand-in for offline load tests.
+# A dotted path to a listings.gateways.PaymentGateway subclass also works.
+PAYMENT_GATEWAY = os.environ.get('PAYMENT_GATEWAY', 'chapa')
+PAYMENT_SIMULATOR = {
+    'latency': float(os.environ.get('PAYMENT_SIMULATOR_LATENCY', 0.05)),
+    'jitter': float(os.environ.get('PAYMENT_SIMULATOR_JITTER', 0)),
+    'failure_rate': float(os.environ.get('PAYMENT_SIMULATOR_FAILURE_RATE', 0)),
+    'decline_rate': float(os.environ.get('PAYMENT_SIMULATOR_DECLINE_RATE', 0)),
+    'settle_after': float(os.environ.get('PAYMENT_SIMULATOR_SETTLE_AFTER', 0.1)),
+    'webhooks': os.environ.get('PAYMENT_SIMULATOR_WEBHOOKS', 'True') == 'True',
+}
+# Defaults to this deployment's own webhook endpoint when unset
+CHAPA_CALLBACK_URL = os.environ.get('CHAPA_CALLBACK_URL')
+
+# Celery: the in-memory transport lets workers run without RabbitMQ locally,
+# and CELERY_TASK_ALWAYS_EAGER=True runs tasks inline with no worker at all
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'memory://')
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER') == 'True'
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-pending-payments': {
+        'task': 'listings.tasks.reconcile_pending_payments',
+        'schedule': 300.0,
+    },
+}
+
+# Pending payments younger than this are left to the webhook
+PAYMENT_RECONCILE_AFTER = timedelta(minutes=10)
+# Pending payments older than this that the gateway still reports as unpaid are failed
+PAYMENT_STALE_AFTER = timedelta(hours=24)
+PAYMENT_RECONCILE_BATCH_SIZE = 100
+PAYMENT_RECONCILE_CONCURRENCY = 8
+# Upper bound on how long one booking's initiate call may hold its in-flight lock.
+# The lock lives in the default cache, which must be shared between processes in production.
+PAYMENT_INITIATE_LOCK_TIMEOUT = 60
+
+# Upper bound on items per bulk create request, and rows per bulk_create transaction
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 5000))
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 500))
+# Rows per keyset query when streaming CSV/NDJSON exports
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# Nightly price adjustments on top of price_per_night (see listings/pricing.py), as a JSON list, e.g.
+# [{"kind": "weekday", "weekdays": [4, 5], "adjustment": "0.20"},
+#  {"kind": "season", "start": "2026-12-15", "end": "2027-01-05", "adjustment": "0.30"}]
+PRICING_RULES = json.loads(os.environ.get('PRICING_RULES', '[]'))
+# Upper bounds on listings and stays priced by one quote request
+QUOTE_MAX_LISTINGS = int(os.environ.get('QUOTE_MAX_LISTINGS', 500))
+QUOTE_MAX_STAYS = int(os.environ.get('QUOTE_MAX_STAYS', 20))
+
+# Share of requests timed by RequestMetricsMiddleware (Server-Timing header and per-view stats)
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 0.1))
+# Sampled requests issuing more queries than this are logged as likely N+1s
+REQUEST_METRICS_QUERY_WARNING = int(os.environ.get('REQUEST_METRICS_QUERY_WARNING', 20))
@@ -0,0 +1,123 @@
+"""
+Batch creation for the listing and booking viewsets.
+
+``POST <resource>/bulk/`` takes a JSON list of items (or ``{"items": [...]}``).
+Every item is validated with the viewset's serializer, valid items are
+inserted with ``bulk_create`` one chunk and one transaction at a time, and
+the response reports the created pks and the errors by item index. Since
+``bulk_create`` sends no model signals, the viewsets do the cache and
+search-index upkeep of signals.py themselves in ``bulk_created``.
+"""
+from bisect import bisect_left
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .serializers import PrefetchedPrimaryKeyRelatedField
+
+
+
+class BulkCreateMixin:
+    def bulk_items(self, request):
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({'detail': 'Expected a non-empty list of items.'})
+        if len(items) > settings.BULK_MAX_ITEMS:
+            raise ValidationError({'detail': f'At most {settings.BULK_MAX_ITEMS} items can be sent at once.'})
+        return items
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        items = self.bulk_items(request)
+        # one serializer validates every item, so its fields are only built once
+        serializer = self.get_serializer()
+        serializer.context['related_objects'] = self.bulk_related_objects(serializer, items)
+
+        errors = []
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, serializer.run_validation(item)))
+            except ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+
+        model = serializer.Meta.model
+        pk_name = model._meta.pk.name
+        created = []
+        size = settings.BULK_CHUNK_SIZE
+        for start in range(0, len(valid), size):
+            chunk = valid[start:start + size]
+            with transaction.atomic():
+                accepted = []
+                for index, data, error in self.bulk_check(chunk):
+                    if error is None:
+                        accepted.append((index, model(**data)))
+                    else:
+                        errors.append({'index': index, 'errors': error})
+                instances = model.objects.bulk_create([instance for _, instance in accepted])
+                self.bulk_created(instances)
+            created.extend({'index': index, pk_name: instance.pk} for index, instance in accepted)
+
+        errors.sort(key=lambda error: error['index'])
+        if not created:
+            code = status.HTTP_400_BAD_REQUEST
+        elif errors:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_201_CREATED
+        return Response({'created': created, 'errors': errors}, status=code)
+
+    def bulk_related_objects(self, serializer, items):
+        """Fetch every row the items reference by pk in one query per relation."""
+        related = {}
+        for name, field in serializer.fields.items():
+            if field.read_only or not isinstance(field, PrefetchedPrimaryKeyRelatedField):
+                continue
+            model = field.get_queryset().model
+            pks = set()
+            for item in items:
+                if isinstance(item, dict) and item.get(name) is not None:
+                    try:
+                        pks.add(model._meta.pk.to_python(item[name]))
+                    except (TypeError, ValueError, DjangoValidationError):
+                        pass
+            related.setdefault(model, {}).update(field.get_queryset().in_bulk(pks))
+        return related
+
+    def bulk_check(self, chunk):
+        """Yield ``(index, validated_data, error)``; runs inside the chunk's transaction."""
+        for index, data in chunk:
+            yield index, data, None
+
+    def bulk_created(self, instances):
+        pass
+
+
+
+class StayCalendar:
+    """
+    Active stays per listing, sorted by check-in, for overlap checks without
+    a query per item. Stays on a listing never overlap, so a new stay clashes
+    exactly when the last stay starting before its check-out ends after its
+    check-in.
+    """
+    def __init__(self, stays):
+        self._starts = {}
+        self._ends = {}
+        for listing_id, check_in, check_out in sorted(stays, key=lambda stay: stay[1]):
+            self._starts.setdefault(listing_id, []).append(check_in)
+            self._ends.setdefault(listing_id, []).append(check_out)
+
+    def reserve(self, listing_id, check_in, check_out):
+        """Add the stay and return True, or return False if it overlaps one already held."""
+        starts = self._starts.setdefault(listing_id, [])
+        ends = self._ends.setdefault(listing_id, [])
+        position = bisect_left(starts, check_out)
+        if position and ends[position - 1] > check_in:
+            return False
+        starts.insert(position, check_in)
+        ends.insert(position, check_out)
+        return True
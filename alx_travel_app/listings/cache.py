@@ -0,0 +1,63 @@
+"""
+Response cache for the listing catalogue.
+
+Entries are keyed on a generation token: one token covers every list page
+and each listing has its own token for its detail responses. Changing a
+listing, booking or review swaps the affected tokens once the change
+commits (see signals.py), so stale entries are never read again and age
+out via TTL/LRU culling. Tokens are random rather than counters so a
+culled token can never resurrect old entries.
+"""
+import hashlib
+import uuid
+from django.core.cache import caches
+from django.db import transaction
+
+
+LIST_TOKEN = 'listings:list-token'
+
+
+def get_cache():
+    return caches['listings']
+
+
+def _token(key):
+    cache = get_cache()
+    token = cache.get(key)
+    if token is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        token = cache.get(key)
+    return token
+
+
+def _variant(request):
+    # next/previous links are absolute, so the host is part of the variant
+    query = sorted(request.query_params.lists())
+    raw = f'{request.get_host()}?{query}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def list_key(request):
+    return f'listings:list:{_token(LIST_TOKEN)}:{_variant(request)}'
+
+
+def detail_key(pk, request):
+    return f'listings:detail:{pk}:{_token(f"listings:detail-token:{pk}")}:{_variant(request)}'
+
+
+def invalidate_listing(pk):
+    invalidate_listings([pk])
+
+
+def invalidate_listings(pks):
+    """Swap the list token and the detail tokens of every given listing in one round-trip."""
+    tokens = {LIST_TOKEN: uuid.uuid4().hex}
+    tokens.update({f'listings:detail-token:{pk}': uuid.uuid4().hex for pk in pks})
+    get_cache().set_many(tokens, timeout=None)
+
+
+def invalidate_on_commit(pks):
+    """``invalidate_listings`` once the current transaction commits, or at once outside one."""
+    # swapped before the commit, a concurrent read would re-cache the old rows under the new token
+    pks = list(pks)
+    transaction.on_commit(lambda: invalidate_listings(pks))
@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import threading
+import time
+import weakref
+import httpx
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .gateways.base import GatewayError
+
+
+logger = logging.getLogger(__name__)
+
+FAILED_STATUSES = {'failed', 'cancelled', 'reversed'}
+
+
+
+class ChapaError(GatewayError):
+    """The gateway could not be reached or sent back something unreadable."""
+
+
+
+class LatencyStats:
+    """Thread-safe running latency totals per gateway operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, operation, elapsed_ms, failed=False):
+        with self._lock:
+            stats = self._operation(operation)
+            stats['calls'] += 1
+            stats['errors'] += int(failed)
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def merge(self, other):
+        """Add another collector's totals to these."""
+        with other._lock:
+            totals = {operation: dict(stats) for operation, stats in other._stats.items()}
+        with self._lock:
+            for operation, theirs in totals.items():
+                stats = self._operation(operation)
+                for key in ('calls', 'errors', 'total_ms'):
+                    stats[key] += theirs[key]
+                stats['max_ms'] = max(stats['max_ms'], theirs['max_ms'])
+
+    def _operation(self, operation):
+        return self._stats.setdefault(operation, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                operation: dict(stats, avg_ms=stats['total_ms'] / stats['calls'])
+                for operation, stats in self._stats.items()
+            }
+
+
+
+class ChapaClient:
+    """
+    Keep-alive client for the Chapa API.
+
+    One pooled session is shared by every request thread, so payments reuse
+    TLS connections instead of handshaking per call. Every request is bounded
+    by a (connect, read) timeout. Connection failures are retried with
+    exponential backoff for any method, but read failures and 5xx responses
+    are only retried for idempotent methods, so a slow ``initialize`` is
+    never sent twice.
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url, secret_key, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff_factor=0.3, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.stats = LatencyStats()
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {secret_key}',
+        })
+
+    def initialize(self, payload):
+        return self._request('initialize', 'POST', '/transaction/initialize', json=payload)
+
+    def verify(self, txn_ref):
+        return self._request('verify', 'GET', f'/transaction/verify/{txn_ref}')
+
+    def _request(self, operation, method, path, **kwargs):
+        """Return ``(status_code, json_body)`` or raise ``ChapaError``."""
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            data = response.json()
+        except (requests.RequestException, ValueError) as exc:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.stats.record(operation, elapsed_ms, failed=True)
+            logger.warning('chapa %s failed after %.1fms: %s', operation, elapsed_ms, exc)
+            raise ChapaError(str(exc)) from exc
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats.record(operation, elapsed_ms, failed=response.status_code >= 500)
+        logger.debug('chapa %s -> %s in %.1fms', operation, response.status_code, elapsed_ms)
+        return response.status_code, data
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncChapaClient:
+    """
+    The ``ChapaClient`` API on a pooled ``httpx.AsyncClient``, for the async
+    payment views: a gateway round-trip is awaited instead of holding a
+    thread. Timeouts and retry rules match ``ChapaClient``: connection
+    failures are retried by the transport for any method, read failures and
+    retryable statuses only for ``verify``.
+    """
+    RETRY_STATUSES = ChapaClient.RETRY_STATUSES
+    READ_ERRORS = (httpx.ReadError, httpx.ReadTimeout, httpx.RemoteProtocolError)
+
+    def __init__(self, base_url, secret_key, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff_factor=0.3, pool_size=100, stats=None):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.stats = stats if stats is not None else LatencyStats()
+
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'),
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {secret_key}'},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(retries=max_retries, limits=limits),
+        )
+
+    async def initialize(self, payload):
+        return await self._request('initialize', 'POST', '/transaction/initialize', json=payload)
+
+    async def verify(self, txn_ref):
+        return await self._request('verify', 'GET', f'/transaction/verify/{txn_ref}', idempotent=True)
+
+    async def _request(self, operation, method, path, idempotent=False, **kwargs):
+        """Return ``(status_code, json_body)`` or raise ``ChapaError``."""
+        start = time.perf_counter()
+        attempts = self.max_retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(self.backoff_factor * 2 ** (attempt - 1))
+            retries_left = attempt + 1 < attempts
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except self.READ_ERRORS as exc:
+                if retries_left:
+                    continue
+                raise self._failed(operation, start, exc)
+            except httpx.HTTPError as exc:
+                raise self._failed(operation, start, exc)
+            if response.status_code in self.RETRY_STATUSES and retries_left:
+                continue
+            break
+
+        try:
+            data = response.json()
+        except ValueError as exc:
+            raise self._failed(operation, start, exc)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats.record(operation, elapsed_ms, failed=response.status_code >= 500)
+        logger.debug('chapa %s -> %s in %.1fms', operation, response.status_code, elapsed_ms)
+        return response.status_code, data
+
+    def _failed(self, operation, start, exc):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats.record(operation, elapsed_ms, failed=True)
+        logger.warning('chapa %s failed after %.1fms: %s', operation, elapsed_ms, exc)
+        return ChapaError(str(exc))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def initialize_payload(booking, txn_ref, callback_url):
+    """The Chapa ``transaction/initialize`` body for paying ``booking`` in full."""
+    return {
+        "amount": f'{booking.total_price:.2f}',
+        "currency": "ETB",
+        "email": booking.traveler.email,
+        "first_name": booking.traveler.first_name,
+        "last_name": booking.traveler.last_name,
+        "phone_number": booking.traveler.phone,
+        "tx_ref": txn_ref,
+        "callback_url": callback_url,
+        "return_url": "http://127.0.0.1:8000/api/bookings/",
+        "customization": {
+            "title": "ALX Travel App",
+            "description": "Payment for bookings"
+        }
+    }
+
+
+def settlement_for(gateway_status):
+    """True/False for a final Chapa transaction status, None while it is still pending."""
+    gateway_status = (gateway_status or '').lower()
+    if gateway_status == 'success':
+        return True
+    if gateway_status in FAILED_STATUSES:
+        return False
+    return None
+
+
+def sign_payload(body):
+    """The HMAC-SHA256 signature Chapa sends with a webhook body."""
+    return hmac.new((settings.CHAPA_WEBHOOK_SECRET or '').encode(), body, hashlib.sha256).hexdigest()
+
+
+def signature_is_valid(body, signature):
+    """Check a webhook body against its HMAC-SHA256 signature header."""
+    if not settings.CHAPA_WEBHOOK_SECRET or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(body), signature)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client, built from the CHAPA_* settings on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ChapaClient(
+                    base_url=settings.CHAPA_BASE_URL,
+                    secret_key=settings.CHAPA_SECRET_KEY,
+                    connect_timeout=settings.CHAPA_CONNECT_TIMEOUT,
+                    read_timeout=settings.CHAPA_READ_TIMEOUT,
+                    max_retries=settings.CHAPA_MAX_RETRIES,
+                    pool_size=settings.CHAPA_POOL_SIZE,
+                )
+    return _client
+
+
+# httpx connections belong to the event loop that opened them, so each loop
+# (one per ASGI worker; one per request when async views run under WSGI) gets its own
+_async_clients = weakref.WeakKeyDictionary()
+# shared by every loop's client, so the totals outlive the per-request loops
+_async_stats = LatencyStats()
+
+
+def get_async_client():
+    """The running event loop's async client, built from the CHAPA_* settings on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncChapaClient(
+            base_url=settings.CHAPA_BASE_URL,
+            secret_key=settings.CHAPA_SECRET_KEY,
+            connect_timeout=settings.CHAPA_CONNECT_TIMEOUT,
+            read_timeout=settings.CHAPA_READ_TIMEOUT,
+            max_retries=settings.CHAPA_MAX_RETRIES,
+            pool_size=settings.CHAPA_ASYNC_POOL_SIZE,
+            stats=_async_stats,
+        )
+    return client
+
+
+def latency_snapshot():
+    """Per-operation latency of every gateway call made by this process's clients, sync and async."""
+    combined = LatencyStats()
+    client = _client
+    if client is not None:
+        combined.merge(client.stats)
+    combined.merge(_async_stats)
+    return combined.snapshot()
+
+
+@receiver(setting_changed)
+def reset_client(setting, **kwargs):
+    global _client, _async_stats
+    if not setting.startswith('CHAPA_'):
+        return
+    # async clients cannot be closed from here; their pools are dropped with them
+    _async_clients.clear()
+    _async_stats = LatencyStats()
+    if _client is not None:
+        with _client_lock:
+            _client.close()
+            _client = None
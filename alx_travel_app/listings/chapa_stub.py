@@ -0,0 +1,104 @@
+"""
+A local stand-in for the Chapa API, for tests and offline load runs.
+
+    with ChapaStubServer() as stub:
+        with override_settings(CHAPA_BASE_URL=stub.url):
+            ...
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+
+class ChapaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out as separate writes; Nagle would hold the body for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        stub.record('initialize', payload)
+        if self.path.rstrip('/').endswith('/transaction/initialize'):
+            self.respond(200, {
+                'message': 'Hosted Link',
+                'status': 'success',
+                'data': {'checkout_url': f'{stub.url}/checkout/{payload.get("tx_ref")}'},
+            })
+        else:
+            self.respond(404, {'message': 'Not found', 'status': 'failed'})
+
+    def do_GET(self):
+        stub = self.server.stub
+        match = re.search(r'/transaction/verify/(?P<txn_ref>[^/]+)/?$', self.path)
+        if match is None:
+            self.respond(404, {'message': 'Not found', 'status': 'failed'})
+            return
+        txn_ref = match.group('txn_ref')
+        stub.record('verify', txn_ref)
+        self.respond(200, {
+            'message': 'Payment details',
+            'status': 'success',
+            'data': {'tx_ref': txn_ref, 'status': stub.verify_status},
+        })
+
+    def respond(self, code, body):
+        if self.server.stub.delay:
+            time.sleep(self.server.stub.delay)
+        content = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+
+class ChapaStubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # room for a burst of concurrent connects from the async client pool
+    request_queue_size = 128
+
+
+
+class ChapaStubServer:
+    """Serves the initialize/verify endpoints on an ephemeral localhost port."""
+
+    def __init__(self, verify_status='success', delay=0):
+        self.verify_status = verify_status
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+        self._server = ChapaStubHTTPServer(('127.0.0.1', 0), ChapaStubHandler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def record(self, operation, payload):
+        with self._lock:
+            self.calls.append((operation, payload))
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
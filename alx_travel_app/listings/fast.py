@@ -0,0 +1,163 @@
+"""
+Read-only fast path for large list responses.
+
+``compile_serializer`` turns a serializer whose fields all map onto model
+columns or query annotations into one generated function from a
+``values()`` row to the same dict ``serializer.data`` would produce, using
+the very same field ``to_representation`` methods. Lists then skip model
+instantiation and the per-row field machinery, and render byte-identical
+JSON. Serializers with nested, method or otherwise computed fields are not
+compiled and keep the regular path.
+"""
+import decimal
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.timezone import is_aware
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PKOnlyObject, RelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+def _converter(field):
+    """
+    ``field.to_representation``, specialised for the common field types so
+    that per-row lookups (choices, output format, current timezone) are done
+    once. Exact types only: subclasses may override ``to_representation``.
+    """
+    kind = type(field)
+    if kind is serializers.UUIDField and field.uuid_format == 'hex_verbose':
+        return str
+    if kind is serializers.CharField:
+        return str
+    if kind is serializers.IntegerField:
+        return int
+    if kind is serializers.ChoiceField:
+        choices = field.choice_strings_to_values
+        return lambda value: value if value == '' else choices.get(str(value), value)
+    if kind is serializers.BooleanField:
+        return lambda value: value if value is True or value is False else field.to_representation(value)
+    if kind is serializers.DecimalField:
+        coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        if field.decimal_places is None or field.normalize_output or field.localize or not coerce_to_string:
+            return field.to_representation
+        exponent = decimal.Decimal('.1') ** field.decimal_places
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+
+        def decimal_to_representation(value):
+            if not isinstance(value, decimal.Decimal):
+                return field.to_representation(value)
+            return f'{value.quantize(exponent, rounding=field.rounding, context=context):f}'
+        return decimal_to_representation
+    if kind is serializers.DateTimeField:
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if output_format is None or field_timezone is None:
+            return field.to_representation
+        iso = output_format.lower() == ISO_8601
+
+        def datetime_to_representation(value):
+            if isinstance(value, str) or not is_aware(value):
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone)
+            if iso:
+                value = value.isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return value.strftime(output_format)
+        return datetime_to_representation
+    return field.to_representation
+
+
+def _column_for(field, queryset):
+    """The values() key feeding ``field`` and a converter, or None when it cannot be compiled."""
+    if isinstance(field, serializers.BaseSerializer) or field.source == '*' or len(field.source_attrs) != 1:
+        return None
+    source = field.source
+    if source in queryset.query.annotations:
+        return source, _converter(field)
+
+    try:
+        model_field = queryset.model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete:
+        return None
+    if model_field.is_relation:
+        if not (isinstance(field, RelatedField) and field.use_pk_only_optimization()):
+            return None
+        if field.pk_field is None:
+            # PrimaryKeyRelatedField renders the bare pk; UUIDs are encoded as their str() anyway
+            target = model_field.target_field
+            return model_field.attname, str if target.get_internal_type() == 'UUIDField' else None
+        return model_field.attname, lambda pk: field.to_representation(PKOnlyObject(pk))
+    return model_field.attname, _converter(field)
+
+
+def compile_serializer(serializer, queryset):
+    """
+    Return ``(columns, to_row)`` for ``serializer`` over ``queryset``, or None
+    when some field cannot be read from a values() row.
+    """
+    if type(serializer).to_representation is not serializers.Serializer.to_representation:
+        return None
+
+    columns = []
+    converters = {}
+    lines = ['def to_row(row):']
+    items = []
+    for position, field in enumerate(serializer._readable_fields):
+        mapped = _column_for(field, queryset)
+        if mapped is None:
+            return None
+        column, converter = mapped
+        columns.append(column)
+        lines.append(f'    v{position} = row[{column!r}]')
+        if converter is None:
+            items.append(f'{field.field_name!r}: v{position}')
+        else:
+            converters[f'f{position}'] = converter
+            # as Serializer.to_representation: None is passed through unconverted
+            items.append(f'{field.field_name!r}: None if v{position} is None else f{position}(v{position})')
+    lines.append('    return {' + ', '.join(items) + '}')
+
+    namespace = dict(converters)
+    exec('\n'.join(lines), namespace)
+    return columns, namespace['to_row']
+
+
+def row_keys(queryset, columns, ordering=()):
+    """The values() keys for ``columns``, the primary key and every ``ordering`` field."""
+    pk_name = queryset.model._meta.pk.attname
+    keys = set(columns) | {pk_name}
+    for name in ordering:
+        name = name.lstrip('-')
+        keys.add(pk_name if name == 'pk' else name)
+    return keys
+
+
+
+class FastListMixin:
+    """
+    Serves ``list`` from ``values()`` rows through a compiled serializer,
+    falling back to the regular path when the serializer cannot be compiled.
+    """
+    fast_list = True
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        compiled = compile_serializer(self.get_serializer(), queryset) if self.fast_list else None
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+
+        columns, to_row = compiled
+        ordering = ()
+        if hasattr(self.paginator, 'get_ordering'):
+            # the paginator reads its ordering fields back from each row
+            ordering = self.paginator.get_ordering(request, queryset, self)
+        rows = queryset.values(*row_keys(queryset, columns, ordering))
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response([to_row(row) for row in page])
+        return Response([to_row(row) for row in rows])
@@ -0,0 +1,44 @@
+from rest_framework.filters import BaseFilterBackend
+from . import geo, search
+from .serializers import ListingProximitySerializer
+
+
+
+class ListingSearchFilter(BaseFilterBackend):
+    """``?q=`` full-text search over the listing inverted index, best matches first."""
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search.search(queryset, query)
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get(self.search_param, '').strip():
+            return ('-search_rank', '-pk')
+        return None
+
+
+
+class ListingProximityFilter(BaseFilterBackend):
+    """
+    ``?near=lat,lng`` proximity search, nearest first: every listing within
+    ``radius`` km, or without one the ``k`` nearest.
+    """
+    near_param = 'near'
+
+    def filter_queryset(self, request, queryset, view):
+        if self.near_param not in request.query_params:
+            return queryset
+        params = ListingProximitySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        lat, lng = params.validated_data['near']
+        if 'radius' in params.validated_data:
+            return geo.within(queryset, lat, lng, params.validated_data['radius'])
+        return geo.nearest(queryset, lat, lng, params.validated_data['k'])
+
+    def get_ordering(self, request, queryset, view):
+        if self.near_param in request.query_params:
+            return ('distance', 'pk')
+        return None
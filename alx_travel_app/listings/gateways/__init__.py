@@ -0,0 +1,44 @@
+"""
+Payment gateways behind one interface.
+
+Payment initiation, verification, webhooks and reconciliation all go
+through ``get_gateway()``, picked by PAYMENT_GATEWAY: ``'chapa'`` for the
+Chapa API, ``'simulator'`` for an in-process Chapa stand-in with
+configurable latency, failures and webhooks (PAYMENT_SIMULATOR), so the
+payment flow can be load-tested offline. A dotted path to a
+``PaymentGateway`` subclass works too.
+"""
+import threading
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from .base import GatewayError, PaymentDeclined, PaymentGateway
+
+
+GATEWAYS = {
+    'chapa': 'listings.gateways.chapa.ChapaGateway',
+    'simulator': 'listings.gateways.simulator.SimulatedGateway',
+}
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """The process-wide gateway named by PAYMENT_GATEWAY, built on first use."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                name = settings.PAYMENT_GATEWAY
+                _gateway = import_string(GATEWAYS.get(name, name)).from_settings()
+    return _gateway
+
+
+@receiver(setting_changed)
+def reset_gateway(setting, **kwargs):
+    global _gateway
+    if setting.startswith(('PAYMENT_GATEWAY', 'PAYMENT_SIMULATOR', 'CHAPA_')):
+        with _gateway_lock:
+            _gateway = None
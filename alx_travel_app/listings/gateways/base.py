@@ -0,0 +1,52 @@
+class GatewayError(Exception):
+    """The gateway could not be reached or sent back something unreadable."""
+
+
+
+class PaymentDeclined(Exception):
+    """The gateway answered but refused to start the payment."""
+
+    def __init__(self, response):
+        super().__init__('Payment declined by the gateway')
+        self.response = response
+
+
+
+class PaymentGateway:
+    """
+    What the payment views and tasks need from a gateway. ``initialize``
+    returns the checkout URL for paying ``booking`` in full under
+    ``txn_ref``; ``verify`` returns True/False once the payment is final
+    and None while it is pending or unknown to the gateway. Both raise
+    ``GatewayError`` when the gateway cannot be asked, and have awaitable
+    twins for the async views. Incoming webhooks are checked with
+    ``webhook_is_valid`` and read with ``webhook_event``.
+    """
+    name = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls()
+
+    def initialize(self, booking, txn_ref, callback_url):
+        raise NotImplementedError
+
+    def verify(self, txn_ref):
+        raise NotImplementedError
+
+    async def ainitialize(self, booking, txn_ref, callback_url):
+        raise NotImplementedError
+
+    async def averify(self, txn_ref):
+        raise NotImplementedError
+
+    def webhook_is_valid(self, body, headers):
+        raise NotImplementedError
+
+    def webhook_event(self, data):
+        """``(txn_ref, settlement)`` for a webhook payload, settlement as ``verify`` returns it."""
+        raise NotImplementedError
+
+    def latency_stats(self):
+        """Per-operation call latency recorded in this process, as ``LatencyStats.snapshot()`` returns it."""
+        return {}
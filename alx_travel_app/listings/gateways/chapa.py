@@ -0,0 +1,42 @@
+from ..chapa import get_async_client, get_client, initialize_payload, latency_snapshot, settlement_for, signature_is_valid
+from .base import PaymentDeclined, PaymentGateway
+
+
+
+class ChapaGateway(PaymentGateway):
+    """The Chapa API through the pooled clients in listings.chapa."""
+    name = 'Chapa'
+
+    def initialize(self, booking, txn_ref, callback_url):
+        status_code, data = get_client().initialize(initialize_payload(booking, txn_ref, callback_url))
+        return self.checkout_url(status_code, data)
+
+    def verify(self, txn_ref):
+        return self.settlement(*get_client().verify(txn_ref))
+
+    async def ainitialize(self, booking, txn_ref, callback_url):
+        status_code, data = await get_async_client().initialize(initialize_payload(booking, txn_ref, callback_url))
+        return self.checkout_url(status_code, data)
+
+    async def averify(self, txn_ref):
+        return self.settlement(*await get_async_client().verify(txn_ref))
+
+    def checkout_url(self, status_code, data):
+        if status_code != 200 or data.get('status') != 'success':
+            raise PaymentDeclined(data)
+        return data['data']['checkout_url']
+
+    def settlement(self, status_code, data):
+        if status_code == 200 and data.get('status') == 'success':
+            return settlement_for(data['data']['status'])
+        return None
+
+    def webhook_is_valid(self, body, headers):
+        signature = headers.get('Chapa-Signature') or headers.get('X-Chapa-Signature')
+        return signature_is_valid(body, signature)
+
+    def webhook_event(self, data):
+        return data.get('tx_ref') or data.get('trx_ref'), settlement_for(data.get('status'))
+
+    def latency_stats(self):
+        return latency_snapshot()
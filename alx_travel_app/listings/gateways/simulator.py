@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import requests
+from django.conf import settings
+from ..chapa import LatencyStats, sign_payload
+from .base import GatewayError, PaymentDeclined
+from .chapa import ChapaGateway
+
+
+logger = logging.getLogger(__name__)
+
+
+
+def post_webhook(url, body, headers):
+    """Deliver a simulated webhook over HTTP, the way Chapa would."""
+    try:
+        requests.post(url, data=body, headers=headers, timeout=5)
+    except requests.RequestException as exc:
+        logger.warning('simulated webhook to %s failed: %s', url, exc)
+
+
+
+class SimulatedGateway(ChapaGateway):
+    """
+    An in-process Chapa stand-in for load tests and offline runs.
+
+    Every call takes ``latency`` seconds (plus or minus up to ``jitter``)
+    and fails with ``GatewayError`` at ``failure_rate``. Each initialized
+    payment is decided up front: it ends failed at ``decline_rate`` and
+    succeeded otherwise, but ``verify`` reports it pending until
+    ``settle_after`` seconds have passed. When ``webhooks`` is on, a
+    Chapa-shaped event signed with CHAPA_WEBHOOK_SECRET is then handed to
+    ``deliver(url, body, headers)``, which POSTs it to the payment's
+    callback URL by default. Webhooks are inherited from ChapaGateway, so
+    the regular webhook endpoint settles simulated payments.
+    """
+    name = 'Simulator'
+
+    def __init__(self, latency=0.05, jitter=0.0, failure_rate=0.0, decline_rate=0.0,
+                 settle_after=0.1, webhooks=True, seed=None, deliver=post_webhook):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.settle_after = settle_after
+        self.webhooks = webhooks
+        self.deliver = deliver
+        self.stats = LatencyStats()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # txn_ref -> (final status, monotonic time it settles at)
+        self._ledger = {}
+
+    @classmethod
+    def from_settings(cls):
+        return cls(**settings.PAYMENT_SIMULATOR)
+
+    def initialize(self, booking, txn_ref, callback_url):
+        delay, fails = self._roll()
+        time.sleep(delay)
+        return self._initialized('initialize', delay, fails, booking, txn_ref, callback_url)
+
+    def verify(self, txn_ref):
+        delay, fails = self._roll()
+        time.sleep(delay)
+        return self._verified('verify', delay, fails, txn_ref)
+
+    async def ainitialize(self, booking, txn_ref, callback_url):
+        delay, fails = self._roll()
+        await asyncio.sleep(delay)
+        return self._initialized('initialize', delay, fails, booking, txn_ref, callback_url)
+
+    async def averify(self, txn_ref):
+        delay, fails = self._roll()
+        await asyncio.sleep(delay)
+        return self._verified('verify', delay, fails, txn_ref)
+
+    def latency_stats(self):
+        return self.stats.snapshot()
+
+    def _roll(self):
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            return delay, self._random.random() < self.failure_rate
+
+    def _initialized(self, operation, delay, fails, booking, txn_ref, callback_url):
+        self.stats.record(operation, delay * 1000, failed=fails)
+        if fails:
+            raise GatewayError('simulated gateway failure')
+        if booking.total_price is None or booking.total_price <= 0:
+            raise PaymentDeclined({'message': 'Invalid amount', 'status': 'failed', 'data': None})
+
+        with self._lock:
+            outcome = 'failed' if self._random.random() < self.decline_rate else 'success'
+            self._ledger[txn_ref] = (outcome, time.monotonic() + self.settle_after)
+        if self.webhooks and callback_url:
+            timer = threading.Timer(self.settle_after, self._send_webhook, args=(callback_url, txn_ref, outcome))
+            timer.daemon = True
+            timer.start()
+        return f'https://checkout.simulator.invalid/{txn_ref}'
+
+    def _verified(self, operation, delay, fails, txn_ref):
+        self.stats.record(operation, delay * 1000, failed=fails)
+        if fails:
+            raise GatewayError('simulated gateway failure')
+        with self._lock:
+            outcome, settles_at = self._ledger.get(txn_ref, (None, None))
+        if outcome is None or time.monotonic() < settles_at:
+            return None
+        return outcome == 'success'
+
+    def _send_webhook(self, callback_url, txn_ref, outcome):
+        body = json.dumps({'event': f'charge.{outcome}', 'tx_ref': txn_ref, 'status': outcome}).encode()
+        headers = {'Content-Type': 'application/json', 'Chapa-Signature': sign_payload(body)}
+        self.deliver(callback_url, body, headers)
@@ -0,0 +1,151 @@
+"""
+Proximity search over listing coordinates.
+
+Every listing with coordinates stores its geohash, so each geohash cell is
+one contiguous key range of an ordinary B-tree index, on MySQL and SQLite
+alike. A radius query picks the finest precision whose cells are at least
+the radius across and reads the 3x3 block of cells around the centre: nine
+index range scans at most, with great-circle distances computed only for
+the rows inside them. A k-nearest query finds the finest block holding k
+listings by binary search over the precision, then runs a radius query out
+to the k-th nearest of them.
+"""
+import math
+from django.db import models
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# 9 characters is a cell of about 5m x 5m
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    value = bits = 0
+    even = True
+    while len(chars) < precision:
+        bounds, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (bounds[0] + bounds[1]) / 2
+        if coordinate >= middle:
+            value = value * 2 + 1
+            bounds[0] = middle
+        else:
+            value = value * 2
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            value = bits = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(latitude degrees, longitude degrees) spanned by one cell."""
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** (bits - bits // 2)
+
+
+def block(lat, lng, precision):
+    """The cell holding (lat, lng) and its eight neighbours."""
+    lat_deg, lng_deg = cell_size(precision)
+    cells = set()
+    for dlat in (-lat_deg, 0, lat_deg):
+        for dlng in (-lng_deg, 0, lng_deg):
+            neighbour_lat = min(90.0, max(-90.0, lat + dlat))
+            neighbour_lng = (lng + dlng + 180) % 360 - 180
+            cells.add(encode(neighbour_lat, neighbour_lng, precision))
+    return sorted(cells)
+
+
+def covering_cells(lat, lng, radius_km):
+    """
+    Cells that together hold every point within ``radius_km`` of (lat, lng),
+    or None when the circle is too large (or too close to a pole) to cover.
+    """
+    # cells are narrowest at the latitude furthest from the equator the circle reaches
+    reach = min(90.0, abs(lat) + radius_km / KM_PER_DEGREE)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_deg, lng_deg = cell_size(precision)
+        height_km = lat_deg * KM_PER_DEGREE
+        width_km = lng_deg * KM_PER_DEGREE * math.cos(math.radians(reach))
+        if min(height_km, width_km) >= radius_km:
+            return block(lat, lng, precision)
+    return None
+
+
+def _successor(prefix):
+    """The first geohash sorting after every geohash that starts with ``prefix``."""
+    head = prefix.rstrip(BASE32[-1])
+    if not head:
+        return None
+    return head[:-1] + BASE32[BASE32.index(head[-1]) + 1]
+
+
+def in_cells(cells):
+    """
+    A filter for listings inside ``cells``. Written as key ranges rather
+    than LIKE 'prefix%', which SQLite cannot answer from the index.
+    """
+    condition = models.Q()
+    for cell in cells:
+        upper = _successor(cell)
+        bounds = models.Q(geohash__gte=cell) if upper is None else models.Q(geohash__gte=cell, geohash__lt=upper)
+        condition |= bounds
+    return condition
+
+
+def distance_km(lat, lng):
+    """Haversine great-circle distance in km from (lat, lng) to each row's coordinates."""
+    half_dlat = Radians(models.F('latitude') - lat) / 2
+    half_dlng = Radians(models.F('longitude') - lng) / 2
+    a = Power(Sin(half_dlat), 2) + math.cos(math.radians(lat)) * Cos(Radians('latitude')) * Power(Sin(half_dlng), 2)
+    # rounding can push a a hair past 1 for antipodal points
+    return models.ExpressionWrapper(
+        2 * EARTH_RADIUS_KM * ASin(Least(Sqrt(a), models.Value(1.0))),
+        output_field=models.FloatField(),
+    )
+
+
+def within(queryset, lat, lng, radius_km):
+    """Listings within ``radius_km`` of (lat, lng), annotated with their ``distance``."""
+    queryset = queryset.exclude(geohash='')
+    cells = covering_cells(lat, lng, radius_km)
+    if cells is not None:
+        queryset = queryset.filter(in_cells(cells))
+    return queryset.annotate(distance=distance_km(lat, lng)).filter(distance__lte=radius_km)
+
+
+def nearest(queryset, lat, lng, k):
+    """The ``k`` listings nearest to (lat, lng) (more on ties), annotated with their ``distance``."""
+    located = queryset.exclude(geohash='')
+    # blocks only grow as the precision drops, so the finest one holding k listings is a binary search away
+    found = None
+    low, high = 1, GEOHASH_PRECISION
+    while low <= high:
+        precision = (low + high) // 2
+        candidates = located.filter(in_cells(block(lat, lng, precision)))
+        if candidates.count() >= k:
+            found = candidates
+            low = precision + 1
+        else:
+            high = precision - 1
+
+    if found is None:
+        # fewer than k listings in even the coarsest block around the point: rank them all
+        found = located
+    # the k nearest are no further away than the k-th nearest of any k candidates
+    kth = (
+        found.annotate(distance=distance_km(lat, lng))
+        .order_by('distance').values_list('distance', flat=True)[k - 1:k]
+    )
+    kth = list(kth)
+    if not kth:
+        # fewer than k located listings in all
+        return located.annotate(distance=distance_km(lat, lng))
+    return within(queryset, lat, lng, kth[0])
@@ -0,0 +1,479 @@
+import asyncio
+import gc
+import json
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import async_to_sync
+from datetime import timedelta
+from django import get_version
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from listings.chapa_stub import ChapaStubServer
+from listings.fast import compile_serializer
+from listings.models import User, Listing, Booking, Payment, BookingChoice, RoleChoice
+from listings.serializers import BookingSerializer, PaymentSerializer
+
+
+PERCENTILES = (50, 95, 99)
+
+# Booking creation from --threads concurrent clients, either each on its own
+# listing or all racing for the same listing and nights
+CONTENTION_SCENARIOS = ('bookings-create-spread', 'bookings-create-hot')
+
+# Serializing --serialize-rows rows with DRF and with the compiled fast path
+SERIALIZATION_SCENARIOS = ('bookings-serialize', 'payments-serialize')
+
+# --inflight verify calls at once through the async endpoint, on one event loop,
+# against a gateway that takes --gateway-delay seconds to answer
+INFLIGHT_SCENARIOS = ('payments-verify-inflight',)
+EXTRA_SCENARIOS = CONTENTION_SCENARIOS + SERIALIZATION_SCENARIOS + INFLIGHT_SCENARIOS
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(timings, queries, errors, wall):
+    ordered = sorted(timings)
+    summary = {
+        'requests': len(timings),
+        'errors': errors,
+        'throughput_rps': round(len(timings) / wall, 1) if wall else None,
+        'mean_ms': round(sum(timings) / len(timings), 3) if timings else None,
+        'max_ms': round(ordered[-1], 3) if ordered else None,
+        'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+    for pct in PERCENTILES:
+        value = percentile(ordered, pct)
+        summary[f'p{pct}_ms'] = round(value, 3) if value is not None else None
+    return summary
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API against a throwaway database seeded with N rows. "
+        "Runs in-process with the payment gateway stubbed or simulated; use DB_ENGINE=sqlite to run without MySQL. "
+        "Reports p50/p95/p99 latency, throughput and SQL queries per request for each scenario."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=200)
+        parser.add_argument('--bookings', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario.')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run the named scenario; may be repeated.')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients for the contention scenarios.')
+        parser.add_argument('--serialize-rows', type=int, default=10000,
+                            help='Rows rendered per run in the serialization scenarios.')
+        parser.add_argument('--inflight', type=int, default=100,
+                            help='Concurrent gateway calls in the in-flight scenario.')
+        parser.add_argument('--gateway', choices=('stub', 'simulator'), default='stub',
+                            help='Chapa stand-in: a local HTTP stub, or the in-process payment simulator.')
+        parser.add_argument('--gateway-delay', type=float, default=0.05,
+                            help='Seconds the gateway takes to answer: in the in-flight scenario with the stub, '
+                                 'on every call with the simulator.')
+        parser.add_argument('--failure-rate', type=float, default=0.0,
+                            help='Share of simulator calls that fail as if the gateway were down.')
+        parser.add_argument('--cached', action='store_true',
+                            help='Leave the listings response cache warm instead of clearing it per request.')
+        parser.add_argument('--output', help='Write JSON results to this file, or "-" for stdout.')
+        parser.add_argument('--compare', help='A previous --output file to diff the results against.')
+
+    def handle(self, *args, **options):
+        scenarios = self.scenarios()
+        selected = options['scenarios'] or list(scenarios) + list(EXTRA_SCENARIOS)
+        unknown = set(selected) - set(scenarios) - set(EXTRA_SCENARIOS)
+        if unknown:
+            choices = ', '.join([*scenarios, *EXTRA_SCENARIOS])
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}. Choose from {choices}.")
+
+        setup_test_environment()
+        # the test database is created next to the configured one and dropped afterwards,
+        # so a benchmark never touches real data
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+            # concurrent clients need a file; shared-cache in-memory databases fail fast on table locks
+            workdir = tempfile.TemporaryDirectory()
+            connection.settings_dict['TEST']['NAME'] = f'{workdir.name}/benchmark.sqlite3'
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command('seed', listings=options['listings'], bookings=options['bookings'],
+                         seed=options['seed'], stdout=self.stderr if options['output'] == '-' else self.stdout)
+            with self.gateway(options):
+                results = self.run(scenarios, selected, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {'meta': self.meta(options), 'scenarios': results}
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)['scenarios']
+
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+        self.write_table(results, baseline)
+
+    @contextmanager
+    def gateway(self, options):
+        if options['gateway'] == 'simulator':
+            self.stub = None
+            simulator = {
+                'latency': options['gateway_delay'],
+                'failure_rate': options['failure_rate'],
+                'settle_after': 0,
+                'webhooks': False,
+                'seed': options['seed'],
+            }
+            with override_settings(PAYMENT_GATEWAY='simulator', PAYMENT_SIMULATOR=simulator):
+                yield
+            return
+        with ChapaStubServer() as self.stub, override_settings(
+            PAYMENT_GATEWAY='chapa', CHAPA_BASE_URL=self.stub.url, CHAPA_SECRET_KEY='benchmark',
+            CHAPA_CALLBACK_URL='http://testserver/',
+        ):
+            yield
+
+    def run(self, scenarios, selected, options):
+        self.client = Client()
+        self.state = {
+            'listings': list(Listing.objects.values_list('pk', flat=True)[:100]),
+            'bookings': list(Booking.objects.values_list('pk', flat=True)[:100]),
+            'pending': list(Booking.objects.filter(status=BookingChoice.PENDING).values_list('pk', flat=True)),
+            'txn_refs': [],
+            'last': None,
+        }
+        if not self.state['listings'] or not self.state['bookings']:
+            raise CommandError('The benchmark needs at least one listing and one booking.')
+        listings_cache = caches['listings']
+
+        results = {}
+        for name in selected:
+            if name in CONTENTION_SCENARIOS:
+                results[name] = self.run_contention(name, options)
+                continue
+            if name in SERIALIZATION_SCENARIOS:
+                results.update(self.run_serialization(name, options))
+                continue
+            if name in INFLIGHT_SCENARIOS:
+                results[name] = self.run_inflight(options)
+                continue
+            request = scenarios[name]
+            self.state['last'] = None
+            for n in range(options['warmup']):
+                self.send(*request(n))
+
+            timings, queries, errors = [], [], 0
+            started = time.perf_counter()
+            for n in range(options['requests']):
+                method, path, data = request(options['warmup'] + n)
+                if not options['cached']:
+                    listings_cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    tick = time.perf_counter()
+                    response = self.send(method, path, data)
+                    timings.append((time.perf_counter() - tick) * 1000)
+                queries.append(len(captured))
+                errors += response.status_code >= 400
+            results[name] = summarize(timings, queries, errors, time.perf_counter() - started)
+        return results
+
+    def run_contention(self, name, options):
+        """
+        Create bookings from concurrent clients and check that no two active
+        bookings on a listing ended up overlapping.
+        """
+        threads = options['threads']
+        hot = name == 'bookings-create-hot'
+        listings = [self.state['listings'][0]] if hot else self.state['listings'][:threads]
+        travelers = list(User.objects.filter(role=RoleChoice.TRAVELER).values_list('pk', flat=True)[:threads])
+        # start past every existing stay so only the racing requests can clash
+        start = Booking.objects.aggregate(last=Max('check_out'))['last'] + timedelta(days=2)
+        path = reverse('listings:booking-view-list')
+        ready = threading.Barrier(threads)
+
+        def client_run(worker):
+            client = Client(raise_request_exception=False)
+            samples = []
+            ready.wait()
+            try:
+                for n in range(options['requests']):
+                    check_in = start + timedelta(days=2 * n)
+                    payload = {
+                        'listing': str(listings[worker % len(listings)]),
+                        'traveler': str(travelers[worker % len(travelers)]),
+                        'num_of_traveler': 1,
+                        'check_in': f'{check_in:%d/%m/%Y}',
+                        'check_out': f'{check_in + timedelta(days=2):%d/%m/%Y}',
+                        'status': BookingChoice.CONFIRMED,
+                    }
+                    with CaptureQueriesContext(connection) as captured:
+                        tick = time.perf_counter()
+                        response = client.post(path, payload, content_type='application/json')
+                        elapsed = (time.perf_counter() - tick) * 1000
+                    samples.append((elapsed, len(captured), response.status_code))
+            finally:
+                connection.close()
+            return samples
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            samples = [sample for worker in pool.map(client_run, range(threads)) for sample in worker]
+        wall = time.perf_counter() - started
+
+        created = sum(code == 201 for _, _, code in samples)
+        rejected = sum(code == 400 for _, _, code in samples)
+        summary = summarize(
+            [elapsed for elapsed, _, _ in samples],
+            [queries for _, queries, _ in samples],
+            len(samples) - created - rejected,
+            wall,
+        )
+        summary.update(threads=threads, created=created, rejected=rejected, overlaps=self.count_overlaps(listings, start))
+        return summary
+
+    def run_serialization(self, name, options):
+        """Render the same rows as JSON through DRF and through the compiled fast path."""
+        count = options['serialize_rows']
+        if name == 'payments-serialize':
+            self.ensure_payments(count)
+            queryset, serializer_class = Payment.objects.order_by('-created_at', '-txn_id'), PaymentSerializer
+        else:
+            queryset, serializer_class = Booking.objects.with_total_price(), BookingSerializer
+        queryset = queryset[:count]
+        renderer = JSONRenderer()
+
+        def drf():
+            return renderer.render(serializer_class(list(queryset), many=True).data)
+
+        def fast():
+            columns, to_row = compile_serializer(serializer_class(), queryset)
+            return renderer.render([to_row(row) for row in queryset.values(*columns)])
+
+        runs = max(1, options['requests'] // 10)
+        results = {}
+        outputs = {}
+        for variant, render in (('drf', drf), ('fast', fast)):
+            timings = []
+            for _ in range(runs + 1):
+                gc.collect()  # garbage from the previous variant must not be billed to this one
+                tick = time.perf_counter()
+                outputs[variant] = render()
+                timings.append((time.perf_counter() - tick) * 1000)
+            timings = timings[1:]  # the first run warms up
+            summary = summarize(timings, [0] * runs, 0, sum(timings) / 1000)
+            summary['rows'] = len(queryset)
+            summary['rows_per_s'] = round(summary['rows'] / (summary['mean_ms'] / 1000))
+            results[f'{name}-{variant}'] = summary
+        results[f'{name}-fast']['identical'] = outputs['drf'] == outputs['fast']
+        results[f'{name}-fast']['speedup'] = round(results[f'{name}-drf']['mean_ms'] / results[f'{name}-fast']['mean_ms'], 2)
+        return results
+
+    def run_inflight(self, options):
+        """
+        Verify --inflight payments concurrently through the async endpoint.
+        A synchronous worker tops out at one call per gateway delay, so the
+        throughput against that ceiling shows how many calls overlapped.
+        """
+        inflight = options['inflight']
+        delay = options['gateway_delay']
+        self.ensure_payments(inflight)
+        txn_refs = list(Payment.objects.values_list('txn_ref', flat=True)[:inflight])
+        path = reverse('chapa-verify-async')
+        client = AsyncClient()
+
+        async def verify(txn_ref):
+            tick = time.perf_counter()
+            response = await client.post(path, {'txn_ref': txn_ref}, content_type='application/json')
+            return (time.perf_counter() - tick) * 1000, response.status_code
+
+        async def verify_all():
+            return await asyncio.gather(*[verify(txn_ref) for txn_ref in txn_refs])
+
+        # the simulator already answers every call after --gateway-delay
+        if self.stub is not None:
+            self.stub.delay = delay
+        try:
+            started = time.perf_counter()
+            samples = async_to_sync(verify_all)()
+            wall = time.perf_counter() - started
+        finally:
+            if self.stub is not None:
+                self.stub.delay = 0
+
+        summary = summarize(
+            [elapsed for elapsed, _ in samples],
+            [],
+            sum(code != 200 for _, code in samples),
+            wall,
+        )
+        summary.update(inflight=len(txn_refs), sync_worker_ceiling_rps=round(1 / delay, 1) if delay else None)
+        return summary
+
+    def ensure_payments(self, count):
+        missing = count - Payment.objects.count()
+        bookings = Booking.objects.with_total_price().filter(payment__isnull=True)[:max(missing, 0)]
+        Payment.objects.bulk_create([
+            Payment(booking=booking, amount=booking.total_price, gateway='Chapa', txn_ref=str(uuid.uuid4()))
+            for booking in bookings
+        ], batch_size=1000)
+
+    def count_overlaps(self, listing_ids, since):
+        overlaps = 0
+        for listing_id in listing_ids:
+            stays = (
+                Booking.objects.active().filter(listing_id=listing_id, check_in__gte=since)
+                .order_by('check_in').values_list('check_in', 'check_out')
+            )
+            previous_end = None
+            for check_in, check_out in stays:
+                if previous_end is not None and check_in < previous_end:
+                    overlaps += 1
+                previous_end = max(previous_end or check_out, check_out)
+        return overlaps
+
+    def send(self, method, path, data):
+        if method == 'post':
+            response = self.client.post(path, data, content_type='application/json')
+        else:
+            response = self.client.get(path, data)
+        if response.status_code >= 400:
+            self.stderr.write(f"{method.upper()} {path} -> {response.status_code}")
+        elif method == 'post' and 'checkout_url' in response.json():
+            self.state['txn_refs'].append(response.json()['payment']['txn_ref'])
+        self.state['last'] = response
+        return response
+
+    def scenarios(self):
+        """Scenario name -> callable returning (method, path, data) for the n-th request."""
+        check_in = timezone.now() + timedelta(days=30)
+        window = {'check_in': f'{check_in:%d/%m/%Y}', 'check_out': f'{check_in + timedelta(days=4):%d/%m/%Y}'}
+
+        def pick(key, n):
+            values = self.state[key]
+            return values[n % len(values)]
+
+        def listing_detail(n):
+            return 'get', reverse('listings:listing-view-detail', args=[pick('listings', n)]), {}
+
+        def booking_detail(n):
+            return 'get', reverse('listings:booking-view-detail', args=[pick('bookings', n)]), {}
+
+        def bookings_walk(n):
+            # follows the previous page's next link, so later requests page deep into the table
+            last = self.state['last']
+            url = last.json().get('next') if last is not None and last.status_code == 200 else None
+            return 'get', url or reverse('listings:booking-view-list'), {}
+
+        def quote(n):
+            # a comparison page: every sampled listing, four weekly stays
+            listings = [str(pk) for pk in self.state['listings']]
+            stays = [
+                {'check_in': f'{check_in + timedelta(weeks=week):%d/%m/%Y}', 'check_out': f'{check_in + timedelta(weeks=week, days=3):%d/%m/%Y}'}
+                for week in range(4)
+            ]
+            return 'post', reverse('listings:listing-view-quote'), {'listings': listings, 'stays': stays}
+
+        def initiate(n):
+            pending = self.state['pending']
+            booking_id = pending.pop() if pending else pick('bookings', n)
+            return 'post', reverse('chapa-initiate'), {'booking_id': str(booking_id)}
+
+        def verify(n):
+            if not self.state['txn_refs']:
+                return 'post', reverse('chapa-verify'), {'txn_ref': 'unknown'}
+            return 'post', reverse('chapa-verify'), {'txn_ref': pick('txn_refs', n)}
+
+        return {
+            'listings-list': lambda n: ('get', reverse('listings:listing-view-list'), {}),
+            'listings-list-expand': lambda n: ('get', reverse('listings:listing-view-list'), {'expand': 'bookings'}),
+            'listings-detail': listing_detail,
+            'listings-available': lambda n: ('get', reverse('listings:listing-view-available'), window),
+            'listings-search': lambda n: ('get', reverse('listings:listing-view-list'), {'q': 'lagos'}),
+            # around Nairobi: within 25km, and the 10 nearest
+            'listings-near': lambda n: ('get', reverse('listings:listing-view-list'), {'near': '-1.2864,36.8172', 'radius': 25}),
+            'listings-nearest': lambda n: ('get', reverse('listings:listing-view-list'), {'near': '-1.2864,36.8172', 'k': 10}),
+            'listings-quote': quote,
+            'listings-revenue': lambda n: ('get', reverse('listings:listing-view-revenue'), {}),
+            'bookings-list': lambda n: ('get', reverse('listings:booking-view-list'), {}),
+            'bookings-list-deep': bookings_walk,
+            'bookings-detail': booking_detail,
+            'reviews-list': lambda n: ('get', reverse('listings:review-view-list'), {}),
+            'payments-initiate': initiate,
+            'payments-verify': verify,
+            'payments-list': lambda n: ('get', reverse('payment-list'), {}),
+        }
+
+    def meta(self, options):
+        try:
+            revision = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            revision = None
+        return {
+            'revision': revision,
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': get_version(),
+            'listings': options['listings'],
+            'bookings': options['bookings'],
+            'seed': options['seed'],
+            'requests': options['requests'],
+            'cached': options['cached'],
+            'threads': options['threads'],
+            'inflight': options['inflight'],
+            'gateway': options['gateway'],
+            'gateway_delay': options['gateway_delay'],
+            'failure_rate': options['failure_rate'],
+        }
+
+    def write_table(self, results, baseline=None):
+        header = f"{'scenario':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'queries':>9}{'errors':>8}"
+        self.stdout.write(header)
+        for name, row in results.items():
+            # queries are not attributable per request while requests overlap on one loop
+            queries = '-' if row['queries_mean'] is None else f"{row['queries_mean']:.1f}"
+            line = (
+                f"{name:<22}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+                f"{row['throughput_rps']:>10.1f}{queries:>9}{row['errors']:>8}"
+            )
+            previous = (baseline or {}).get(name)
+            if 'speedup' in row:
+                line += f"   {row['speedup']}x vs drf, identical={row['identical']}"
+            if 'overlaps' in row:
+                line += f"   created {row['created']} rejected {row['rejected']} overlaps {row['overlaps']}"
+            if 'inflight' in row:
+                line += f"   {row['inflight']} in flight, sync worker ceiling {row['sync_worker_ceiling_rps']} req/s"
+            if previous and previous.get('p95_ms'):
+                change = (row['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100
+                line += f"   p95 {change:+.1f}% vs baseline"
+            self.stdout.write(line)
@@ -0,0 +1,27 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Recompute every listing's rating_avg, review_count and rating_total from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = Listing.objects.order_by('pk').values_list('pk', flat=True)
+        rebuilt = 0
+        last = None
+        while True:
+            batch = list((ids.filter(pk__gt=last) if last else ids)[:batch_size])
+            if not batch:
+                break
+            Listing.objects.rebuild_ratings(batch)
+            rebuilt += len(batch)
+            last = batch[-1]
+
+        caches['listings'].clear()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {rebuilt} listings."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing
+from listings.search import index_listings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the listing full-text search index from titles, locations and descriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        listings = Listing.objects.order_by('pk').only('title', 'location', 'description')
+        indexed = 0
+        last = None
+        while True:
+            batch = list((listings.filter(pk__gt=last) if last else listings)[:batch_size])
+            if not batch:
+                break
+            index_listings(batch)
+            indexed += len(batch)
+            last = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} listings."))
@@ -1,11 +1,17 @@
 import random
+import time
+import uuid
 from decimal import Decimal
 from datetime import timedelta
-from django.core.management.base import BaseCommand
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 
-from listings.models import Listing, Booking, Review, BookingChoice, RoleChoice
+from listings.models import Listing, ListingSearchTerm, Booking, Review, Payment, BookingChoice, RoleChoice
+from listings.search import index_listings
 
 User = get_user_model()
 
@@ -15,6 +21,8 @@ SAMPLE_LISTINGS = [
         "title": "Stone Town Seafront Bungalow",
         "description": "Charming seafront bungalow with ocean views and easy access to the Stone Town nightlife.",
         "location": "Stone Town, Zanzibar, Tanzania",
+        "latitude": -6.1659,
+        "longitude": 39.1925,
         "price_per_night": Decimal("120.00"),
         "max_guests": 4,
     },
@@ -22,6 +30,8 @@ SAMPLE_LISTINGS = [
         "title": "Table Mountain View Apartment",
         "description": "Modern 1-bedroom apartment with spectacular views of Table Mountain and quick access to the V&A Waterfront.",
         "location": "Cape Town, South Africa",
+        "latitude": -33.9249,
+        "longitude": 18.4241,
         "price_per_night": Decimal("90.00"),
         "max_guests": 2,
     },
@@ -29,6 +39,8 @@ SAMPLE_LISTINGS = [
         "title": "Serengeti Mobile Safari Camp (All Inclusive)",
         "description": "Authentic mobile camp experience in the Serengeti. Includes game drives and local meals.",
         "location": "Serengeti, Tanzania",
+        "latitude": -2.3333,
+        "longitude": 34.8333,
         "price_per_night": Decimal("250.00"),
         "max_guests": 6,
     },
@@ -36,6 +48,8 @@ SAMPLE_LISTINGS = [
         "title": "Lagos Boutique Loft",
         "description": "Stylish loft in Ikeja — close to business districts and nightlife. Fast Wi-Fi and secure building.",
         "location": "Ikeja, Lagos, Nigeria",
+        "latitude": 6.6018,
+        "longitude": 3.3515,
         "price_per_night": Decimal("70.00"),
         "max_guests": 3,
     },
@@ -43,6 +57,8 @@ SAMPLE_LISTINGS = [
         "title": "Kente Homestay",
         "description": "Stay with local artisans in Kumasi. Learn about Kente weaving and local cuisine.",
         "location": "Kumasi, Ghana",
+        "latitude": 6.6885,
+        "longitude": -1.6244,
         "price_per_night": Decimal("50.00"),
         "max_guests": 3,
     },
@@ -50,6 +66,8 @@ SAMPLE_LISTINGS = [
         "title": "Marrakech Traditional Riad",
         "description": "Beautiful riad in the Medina with interior courtyard, traditional decor and rooftop terrace.",
         "location": "Marrakech, Morocco",
+        "latitude": 31.6295,
+        "longitude": -7.9811,
         "price_per_night": Decimal("110.00"),
         "max_guests": 4,
     },
@@ -57,6 +75,8 @@ SAMPLE_LISTINGS = [
         "title": "Westlands Short-stay Studio",
         "description": "Cozy studio close to restaurants and tech hubs. Great for business travellers.",
         "location": "Westlands, Nairobi, Kenya",
+        "latitude": -1.2676,
+        "longitude": 36.8108,
         "price_per_night": Decimal("60.00"),
         "max_guests": 2,
     },
@@ -64,6 +84,8 @@ SAMPLE_LISTINGS = [
         "title": "Kigali Hills Cottage",
         "description": "Quiet cottage on the hills with a beautiful garden — ideal for a peaceful getaway.",
         "location": "Kimironko, Kigali, Rwanda",
+        "latitude": -1.9355,
+        "longitude": 30.1263,
         "price_per_night": Decimal("65.00"),
         "max_guests": 4,
     },
@@ -71,6 +93,8 @@ SAMPLE_LISTINGS = [
         "title": "Riverside Guesthouse",
         "description": "Guesthouse near the river, family friendly, home-cooked breakfast available.",
         "location": "Kololo, Kampala, Uganda",
+        "latitude": 0.3317,
+        "longitude": 32.5939,
         "price_per_night": Decimal("55.00"),
         "max_guests": 3,
     },
@@ -78,6 +102,8 @@ SAMPLE_LISTINGS = [
         "title": "Bakau Beach Hut",
         "description": "Simple beach hut steps from the sand — perfect for budget travelers who love the sea.",
         "location": "Bakau, The Gambia",
+        "latitude": 13.4781,
+        "longitude": -16.6819,
         "price_per_night": Decimal("40.00"),
         "max_guests": 2,
     },
@@ -109,113 +135,182 @@ REVIEW_COMMENTS = [
 
 
 class Command(BaseCommand):
-    help = "Seed the DB with authentic African Listings, Bookings and Reviews."
+    help = (
+        "Seed the DB with authentic African Listings, Bookings and Reviews. "
+        "Scales to load-test sizes, e.g. --listings 100000 --bookings 5000000 --seed 42."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=len(SAMPLE_LISTINGS))
+        parser.add_argument('--bookings', type=int, default=30)
+        parser.add_argument('--agents', type=int, help='Defaults to one agent per 20 listings.')
+        parser.add_argument('--travelers', type=int, help='Defaults to one traveler per 10 bookings.')
+        parser.add_argument('--review-rate', type=float, default=0.6,
+                            help='Share of confirmed bookings that leave a review.')
+        parser.add_argument('--seed', type=int, help='Random seed for a reproducible dataset.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--keep', action='store_true', help='Add to existing data instead of clearing it.')
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.WARNING("Clearing existing Booking / Review / Listing data..."))
-        #User.objects.all().delete()
-        Booking.objects.all().delete()
-        Review.objects.all().delete()
-        Listing.objects.all().delete()
-
-        # Create agents (hosts)
-        agents = []
-        for a in AGENTS:
-            user, created = User.objects.get_or_create(
-                email=a["email"],
-                defaults={
-                    "username": a["username"],
-                    "first_name": a["first_name"],
-                    "last_name": a["last_name"],
-                    "phone": a.get("phone", ""),
-                    "role": RoleChoice.AGENT,
-                },
-            )
-            if created:
-                # set a usable password for quick dev access
-                user.set_password("password123")
-                user.save()
-            else:
-                # make sure role is agent
-                user.role = RoleChoice.AGENT
-                user.save()
-            agents.append(user)
-
-        # Create travelers
-        travelers = []
-        for t in TRAVELERS:
-            user, created = User.objects.get_or_create(
-                email=t["email"],
-                defaults={
-                    "username": t["username"],
-                    "first_name": t["first_name"],
-                    "last_name": t["last_name"],
-                    "role": RoleChoice.TRAVELER,
-                },
-            )
-            if created:
-                user.set_password("password123")
-                user.save()
-            travelers.append(user)
-
-        # Create listings, assign agents round-robin
-        self.stdout.write(self.style.WARNING("Creating listings..."))
-        listings = []
-        for idx, item in enumerate(SAMPLE_LISTINGS):
-            agent = agents[idx % len(agents)]
-            listing = Listing.objects.create(
-                agent=agent,
-                title=item["title"],
-                description=item["description"],
-                location=item["location"],
-                price_per_night=item["price_per_night"],
-                max_guests=item["max_guests"],
-            )
-            listings.append(listing)
-
-        # Create bookings
-        self.stdout.write(self.style.WARNING("Creating bookings..."))
-        bookings_created = []
-        for _ in range(30):
-            listing = random.choice(listings)
-            traveler = random.choice(travelers)
-
-            nights = random.randint(1, 7)
-            start_dt = timezone.now() + timedelta(days=random.randint(1, 30), hours=random.randint(0, 12))
-            check_in = start_dt
-            check_out = start_dt + timedelta(days=nights)
-
-            # ensure num_of_traveler <= max_guests
-            num_of_traveler = random.randint(1, listing.max_guests)
-
-            total_price = listing.price_per_night * Decimal(nights)
-
-            status = random.choice([BookingChoice.PENDING, BookingChoice.CONFIRMED, BookingChoice.CANCELLED])
-
-            b = Booking.objects.create(
-                traveler=traveler,
-                listing=listing,
-                num_of_traveler=num_of_traveler,
-                check_in=check_in,
-                check_out=check_out,
-                total_price=total_price,
-                status=status,
-            )
-            bookings_created.append(b)
-
-        # Create reviews for some confirmed bookings (simulate guests leaving reviews)
-        self.stdout.write(self.style.WARNING("Creating reviews for some confirmed bookings..."))
-        confirmed = [b for b in bookings_created if b.status == BookingChoice.CONFIRMED]
-        for b in confirmed:
-            if random.random() < 0.6:  # ~60% of confirmed bookings have reviews
-                rating = random.randint(3, 5)
-                comment = random.choice(REVIEW_COMMENTS)
-                Review.objects.create(
-                    reviewer=b.traveler,
-                    listing=b.listing,
-                    rating=rating,
-                    comment=comment,
-                )
+        if options['listings'] < 1 or options['bookings'] < 0:
+            raise CommandError('--listings must be at least 1 and --bookings cannot be negative')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        if not options['keep']:
+            self.stdout.write(self.style.WARNING("Clearing existing Payment / Booking / Review / Listing data..."))
+            self.clear()
+
+        num_agents = options['agents'] or max(len(AGENTS), options['listings'] // 20)
+        num_travelers = options['travelers'] or max(len(TRAVELERS), options['bookings'] // 10)
 
+        # one hash for every seeded account; hashing per user dominates large runs
+        self.password = make_password("password123")
+        agents = self.seed_users(AGENTS, num_agents, RoleChoice.AGENT, 'agent')
+        travelers = self.seed_users(TRAVELERS, num_travelers, RoleChoice.TRAVELER, 'traveler')
+
+        listings = self.seed_listings(options['listings'], agents)
+        reviews = self.seed_bookings(options['bookings'], listings, travelers, options['review_rate'])
+
+        self.stdout.write(self.style.WARNING("Rebuilding rating aggregates..."))
+        listing_ids = [pk for pk, _ in listings]
+        for start in range(0, len(listing_ids), self.batch_size):
+            Listing.objects.rebuild_ratings(listing_ids[start:start + self.batch_size])
+        caches['listings'].clear()
+
+        elapsed = time.perf_counter() - started
+        total = len(agents) + len(travelers) + len(listings) + options['bookings'] + reviews
         self.stdout.write(self.style.SUCCESS("✅ Seeding complete: Listings, Bookings and Reviews created."))
-        self.stdout.write(self.style.SUCCESS(f"Listings: {len(listings)} | Bookings: {len(bookings_created)} | Reviews: {Review.objects.count()}"))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(
+            f"Listings: {len(listings)} | Bookings: {options['bookings']} | Reviews: {reviews} | "
+            f"{total} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)"
+        ))
+
+    def clear(self):
+        # Raw deletes, children first: the ORM would load every row to run signal handlers.
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in (Payment, Review, ListingSearchTerm, Booking, Listing):
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"  {label}: {count} rows in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    def seed_users(self, named, count, role, prefix):
+        """Return the pks of ``count`` users with ``role``, creating any that are missing."""
+        self.stdout.write(self.style.WARNING(f"Creating {prefix}s..."))
+        started = time.perf_counter()
+        profiles = list(named[:count])
+        for n in range(len(profiles), count):
+            profiles.append({
+                "username": f"{prefix}_{n}",
+                "email": f"{prefix}.{n}@seed.demo.com",
+                "first_name": prefix.title(),
+                "last_name": str(n),
+            })
+
+        pks = []
+        for start in range(0, len(profiles), self.batch_size):
+            chunk = profiles[start:start + self.batch_size]
+            with transaction.atomic():
+                User.objects.bulk_create([
+                    User(
+                        user_id=self.uuid(),
+                        password=self.password,
+                        role=role,
+                        phone=p.get("phone", ""),
+                        username=p["username"],
+                        email=p["email"],
+                        first_name=p["first_name"],
+                        last_name=p["last_name"],
+                    )
+                    for p in chunk
+                ], ignore_conflicts=True)
+                users = User.objects.filter(email__in=[p["email"] for p in chunk])
+                users.exclude(role=role).update(role=role)
+                pks.extend(users.values_list('pk', flat=True))
+        self.report(f"{prefix}s", len(pks), started)
+        return pks
+
+    def seed_listings(self, count, agents):
+        """Create listings round-robin over the agents; return (pk, max_guests) pairs."""
+        self.stdout.write(self.style.WARNING("Creating listings..."))
+        started = time.perf_counter()
+        created = []
+        for start in range(0, count, self.batch_size):
+            batch = []
+            for idx in range(start, min(start + self.batch_size, count)):
+                item = SAMPLE_LISTINGS[idx % len(SAMPLE_LISTINGS)]
+                suffix = f" #{idx // len(SAMPLE_LISTINGS) + 1}" if idx >= len(SAMPLE_LISTINGS) else ""
+                # spread prices +/-25% around the sample so price filters have something to do
+                price = (item["price_per_night"] * Decimal(self.rng.randint(75, 125)) / 100).quantize(Decimal("0.01"))
+                batch.append(Listing(
+                    listing_id=self.uuid(),
+                    agent_id=agents[idx % len(agents)],
+                    title=f"{item['title']}{suffix}"[:100],
+                    description=item["description"],
+                    location=item["location"],
+                    # scattered within a few km of the sample's town centre
+                    latitude=item["latitude"] + self.rng.uniform(-0.05, 0.05),
+                    longitude=item["longitude"] + self.rng.uniform(-0.05, 0.05),
+                    price_per_night=price,
+                    max_guests=item["max_guests"],
+                ))
+            with transaction.atomic():
+                Listing.objects.bulk_create(batch)
+                index_listings(batch)
+            created.extend((listing.pk, listing.max_guests) for listing in batch)
+        self.report("listings", len(created), started)
+        return created
+
+    def seed_bookings(self, count, listings, travelers, review_rate):
+        """
+        Create bookings round-robin over the listings. Each listing keeps its
+        own calendar cursor, so stays on one listing never overlap. Returns the
+        number of reviews left on confirmed bookings.
+        """
+        self.stdout.write(self.style.WARNING("Creating bookings and reviews..."))
+        started = time.perf_counter()
+        today = timezone.now().replace(hour=14, minute=0, second=0, microsecond=0)
+        cursors = [today - timedelta(days=self.rng.randint(180, 365)) for _ in listings]
+        statuses = [BookingChoice.CONFIRMED] * 6 + [BookingChoice.PENDING] * 3 + [BookingChoice.CANCELLED]
+        reviews = 0
+
+        for start in range(0, count, self.batch_size):
+            bookings, review_rows = [], []
+            for n in range(start, min(start + self.batch_size, count)):
+                slot = n % len(listings)
+                listing_id, max_guests = listings[slot]
+                traveler_id = travelers[self.rng.randrange(len(travelers))]
+                check_in = cursors[slot] + timedelta(days=self.rng.randint(0, 3))
+                check_out = check_in + timedelta(days=self.rng.randint(1, 7))
+                cursors[slot] = check_out
+                status = self.rng.choice(statuses)
+                bookings.append(Booking(
+                    booking_id=self.uuid(),
+                    traveler_id=traveler_id,
+                    listing_id=listing_id,
+                    num_of_traveler=self.rng.randint(1, max_guests),
+                    check_in=check_in,
+                    check_out=check_out,
+                    status=status,
+                ))
+                if status == BookingChoice.CONFIRMED and self.rng.random() < review_rate:
+                    review_rows.append(Review(
+                        review_id=self.uuid(),
+                        reviewer_id=traveler_id,
+                        listing_id=listing_id,
+                        rating=self.rng.randint(3, 5),
+                        comment=self.rng.choice(REVIEW_COMMENTS),
+                    ))
+            with transaction.atomic():
+                Booking.objects.bulk_create(bookings)
+                Review.objects.bulk_create(review_rows)
+            reviews += len(review_rows)
+        self.report("bookings", count, started)
+        return reviews
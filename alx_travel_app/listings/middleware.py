@@ -0,0 +1,195 @@
+"""
+Per-view query count and latency instrumentation.
+
+A sampled share of requests (REQUEST_METRICS_SAMPLE_RATE) is timed: SQL
+queries and their time, response rendering time, total time and response
+size. Each sampled response carries a ``Server-Timing`` header, the numbers
+are aggregated per resolved view name (see ``metrics.snapshot()`` and the
+``request-metrics`` endpoint), and requests issuing more than
+REQUEST_METRICS_QUERY_WARNING queries are logged. Aggregates are kept per
+process. The middleware runs natively in both sync and async chains, so it
+does not push async views back onto a thread.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+
+class RequestMetrics:
+    """Counters for one sampled request, doubling as the DB execute wrapper."""
+
+    def __init__(self):
+        self.queries = 0
+        self.repeated = 0
+        self.db_ms = 0.0
+        self.render_ms = 0.0
+        self._render_start = None
+        self._seen = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - start) * 1000
+            self.queries += 1
+            # the same statement issued again within one request is the N+1 signature
+            if sql in self._seen:
+                self.repeated += 1
+            self._seen.add(sql)
+
+    def render_started(self):
+        self._render_start = time.perf_counter()
+
+    def render_finished(self, response):
+        if self._render_start is not None:
+            self.render_ms += (time.perf_counter() - self._render_start) * 1000
+
+
+
+class MetricsRegistry:
+    """Thread-safe running totals per view name."""
+
+    FIELDS = ('queries', 'repeated', 'db_ms', 'render_ms', 'total_ms', 'bytes')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, sample):
+        with self._lock:
+            stats = self._views.get(view_name)
+            if stats is None:
+                stats = self._views[view_name] = {'requests': 0, 'errors': 0}
+                for field in self.FIELDS:
+                    stats[f'{field}_total'] = 0
+                    stats[f'{field}_max'] = 0
+            stats['requests'] += 1
+            stats['errors'] += int(sample['status'] >= 500)
+            for field in self.FIELDS:
+                stats[f'{field}_total'] += sample[field]
+                stats[f'{field}_max'] = max(stats[f'{field}_max'], sample[field])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view_name: {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    **{
+                        f'{field}_avg': round(stats[f'{field}_total'] / stats['requests'], 3)
+                        for field in self.FIELDS
+                    },
+                    **{f'{field}_max': round(stats[f'{field}_max'], 3) for field in self.FIELDS},
+                }
+                for view_name, stats in self._views.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+metrics = MetricsRegistry()
+
+
+# the sampled request whose queries are being counted, per asyncio task
+current_sample = contextvars.ContextVar('request_metrics', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    return sample(execute, sql, params, many, context)
+
+
+def install_query_counter():
+    # left in place: concurrent requests share the connection, and each only counts under its own context
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        request.request_metrics = sample = RequestMetrics()
+        start = time.perf_counter()
+        with connection.execute_wrapper(sample):
+            response = self.get_response(request)
+        return self.finish(request, response, sample, start)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.REQUEST_METRICS_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        request.request_metrics = sample = RequestMetrics()
+        start = time.perf_counter()
+        # the async ORM runs every request's queries on one shared thread and connection;
+        # sync_to_async carries this task's context over, so each query reaches its own request
+        await sync_to_async(install_query_counter)()
+        token = current_sample.set(sample)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_sample.reset(token)
+        return self.finish(request, response, sample, start)
+
+    def finish(self, request, response, sample, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={sample.db_ms:.2f};desc="{sample.queries} queries, {sample.repeated} repeated"',
+            f'render;dur={sample.render_ms:.2f}',
+            f'total;dur={total_ms:.2f}',
+        ])
+
+        match = request.resolver_match
+        if match is None:
+            return response
+        size = 0 if response.streaming else len(response.content)
+        metrics.record(match.view_name, {
+            'status': response.status_code,
+            'queries': sample.queries,
+            'repeated': sample.repeated,
+            'db_ms': sample.db_ms,
+            'render_ms': sample.render_ms,
+            'total_ms': total_ms,
+            'bytes': size,
+        })
+        if sample.queries > settings.REQUEST_METRICS_QUERY_WARNING:
+            logger.warning(
+                '%s %s issued %d queries (%d repeated) in %.1fms db / %.1fms total',
+                request.method, match.view_name, sample.queries, sample.repeated, sample.db_ms, total_ms,
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook returns
+        sample = getattr(request, 'request_metrics', None)
+        if sample is not None:
+            sample.render_started()
+            response.add_post_render_callback(sample.render_finished)
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_alter_booking_options_alter_booking_status_payment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['listing', 'status', 'check_in', 'check_out'], name='booking_availability_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:30
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations, models
+
+
+def backfill_ratings(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    Review = apps.get_model('listings', 'Review')
+    rows = Review.objects.order_by().values('listing').annotate(total=models.Sum('rating'), count=models.Count('pk'))
+    for row in rows.iterator():
+        average = (Decimal(row['total']) / row['count']).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        Listing.objects.filter(pk=row['listing']).update(
+            rating_total=row['total'], review_count=row['count'], rating_avg=average
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_payment_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['rating_avg', 'listing_id'], name='listing_rating_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
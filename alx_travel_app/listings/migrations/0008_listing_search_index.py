@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from listings.search import listing_terms
+
+
+def index_existing_listings(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    ListingSearchTerm = apps.get_model('listings', 'ListingSearchTerm')
+    rows = (
+        ListingSearchTerm(listing_id=listing.pk, term=term, weight=weight)
+        for listing in Listing.objects.only('title', 'location', 'description').iterator()
+        for term, weight in listing_terms(listing).items()
+    )
+    ListingSearchTerm.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_listing_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=50)),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='listings.listing')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('term', 'listing'), name='unique_listing_search_term')],
+            },
+        ),
+        migrations.RunPython(index_existing_listings, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,13 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
 from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
 import uuid
+from . import geo
+from .pricing import get_tariff, rounded_total
 
 
 class RoleChoice(models.TextChoices):
@@ -23,6 +29,15 @@ class PaymentChoice(models.TextChoices):
     CANCELLED = 'Cancelled'
 
 
+ACTIVE_BOOKING_STATUSES = (BookingChoice.PENDING, BookingChoice.CONFIRMED)
+
+
+def rating_average(total, count):
+    if not count:
+        return Decimal('0.00')
+    return (Decimal(total) / count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
 class User(AbstractUser):
     user_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
     first_name = models.CharField(max_length=100, null=False, blank=False)
@@ -35,11 +50,99 @@ class User(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['date_joined', 'user_id'], name='user_keyset_idx'),
+        ]
+
     def __str__(self):
         return f'{self.username} - {self.email} - {self.role}'
 
 
 
+class ListingQuerySet(models.QuerySet):
+    def available(self, check_in, check_out):
+        """Listings with no active booking overlapping [check_in, check_out)."""
+        clashes = Booking.objects.overlapping(check_in, check_out).filter(listing=models.OuterRef('pk'))
+        return self.filter(~models.Exists(clashes))
+
+    def with_booking_count(self):
+        counts = (
+            Booking.objects.filter(listing=models.OuterRef('pk'))
+            .order_by()
+            .values('listing')
+            .annotate(total=models.Count('pk'))
+            .values('total')
+        )
+        return self.annotate(booking_count=Coalesce(models.Subquery(counts), 0))
+
+    def with_revenue(self):
+        revenue = models.Sum(
+            get_tariff().total_expression('price_per_night', 'bookings__check_in', 'bookings__check_out'),
+            filter=models.Q(bookings__status=BookingChoice.CONFIRMED),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+        # rounded again: SQLite adds the totals up as floats, and revenue is a keyset cursor position
+        return self.annotate(revenue=rounded_total(Coalesce(revenue, models.Value(0), output_field=models.DecimalField(max_digits=10, decimal_places=2))))
+
+    def lock(self, listing_ids):
+        """
+        Take row locks on the given listings for the rest of the transaction.
+
+        Bookings for a listing are checked for overlaps under its lock, so two
+        requests for the same listing queue up while different listings never
+        wait on each other. Locks are taken in pk order so multi-listing
+        callers cannot deadlock.
+        """
+        return list(self.select_for_update().filter(pk__in=listing_ids).order_by('pk').values_list('pk', flat=True))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create skips save(), which keeps the geohash in step with the coordinates
+        objs = list(objs)
+        for listing in objs:
+            listing.set_geohash()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def touch(self, listing_ids):
+        """Bump updated_at, for changes to data the listing's representation includes."""
+        self.filter(pk__in=listing_ids).update(updated_at=timezone.now())
+
+    def adjust_rating(self, listing_id, rating_delta, count_delta):
+        """Apply one review's contribution to a listing's rating aggregates in O(1)."""
+        with transaction.atomic():
+            listing = self.select_for_update().only('rating_total', 'review_count').filter(pk=listing_id).first()
+            if listing is None:
+                return
+            total = max(listing.rating_total + rating_delta, 0)
+            count = max(listing.review_count + count_delta, 0)
+            self.filter(pk=listing_id).update(
+                rating_total=total,
+                review_count=count,
+                rating_avg=rating_average(total, count),
+                updated_at=timezone.now(),
+            )
+
+    def rebuild_ratings(self, listing_ids):
+        """Recount rating aggregates for the given listings from their reviews."""
+        rows = (
+            Review.objects.filter(listing__in=listing_ids)
+            .order_by()
+            .values('listing')
+            .annotate(total=models.Sum('rating'), count=models.Count('pk'))
+        )
+        totals = {row['listing']: (row['total'], row['count']) for row in rows}
+        now = timezone.now()
+        listings = []
+        for pk in listing_ids:
+            total, count = totals.get(pk, (0, 0))
+            listings.append(Listing(
+                pk=pk, rating_total=total, review_count=count,
+                rating_avg=rating_average(total, count), updated_at=now,
+            ))
+        self.bulk_update(listings, ['rating_total', 'review_count', 'rating_avg', 'updated_at'])
+
+
+
 class Listing(models.Model):
     listing_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
     agent = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listings')
@@ -48,15 +151,72 @@ class Listing(models.Model):
     location = models.CharField(max_length=100, null=False, blank=False)
     price_per_night = models.DecimalField(max_digits=10, decimal_places=2, null=False)
     max_guests = models.PositiveIntegerField(null=False)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # derived from the coordinates on save, for proximity search (listings.geo)
+    geohash = models.CharField(max_length=geo.GEOHASH_PRECISION, blank=True, default='', editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=Decimal('0.00'))
+    review_count = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    
+    objects = ListingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'listing_id'], name='listing_keyset_idx'),
+            models.Index(fields=['rating_avg', 'listing_id'], name='listing_rating_idx'),
+            models.Index(fields=['location', 'price_per_night'], name='listing_location_price_idx'),
+            models.Index(fields=['geohash'], name='listing_geohash_idx'),
+        ]
+
+    def set_geohash(self):
+        located = self.latitude is not None and self.longitude is not None
+        self.geohash = geo.encode(self.latitude, self.longitude) if located else ''
+
+    def save(self, *args, **kwargs):
+        self.set_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f'{self.title}'
 
 
 
+class ListingSearchTerm(models.Model):
+    """One row of the listing inverted index, maintained by listings.search."""
+    term = models.CharField(max_length=50)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'listing'], name='unique_listing_search_term'),
+        ]
+
+    def __str__(self):
+        return f'{self.term} -> {self.listing_id} ({self.weight})'
+
+
+
+class BookingQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(status__in=ACTIVE_BOOKING_STATUSES)
+
+    def overlapping(self, check_in, check_out):
+        return self.active().filter(check_in__lt=check_out, check_out__gt=check_in)
+
+    def with_total_price(self):
+        return self.annotate(
+            total_price=get_tariff().total_expression('listing__price_per_night', 'check_in', 'check_out')
+        )
+
+
+
 class Booking(models.Model):
     booking_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
     traveler = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings')
@@ -67,16 +227,28 @@ class Booking(models.Model):
     #total_price = models.DecimalField(max_digits=10, decimal_places=2, null=False)
     status = models.CharField(max_length=10, choices=BookingChoice.choices)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BookingQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-booking_id']
+        indexes = [
+            models.Index(fields=['created_at', 'booking_id'], name='booking_keyset_idx'),
+            models.Index(fields=['listing', 'status', 'check_in', 'check_out'], name='booking_availability_idx'),
+            models.Index(fields=['traveler', '-created_at'], name='booking_traveler_recent_idx'),
+        ]
     
     @property
     def total_price(self):
-        num_of_nights = (self.check_out.date() - self.check_in.date()).days
-        if num_of_nights < 1:
-            num_of_nights = 1
-        return float(self.listing.price_per_night * num_of_nights)
+        # annotated by BookingQuerySet.with_total_price(), saving the listing lookup
+        if hasattr(self, '_total_price'):
+            return self._total_price
+        return get_tariff().total(self.listing.price_per_night, self.check_in.date(), self.check_out.date())
+
+    @total_price.setter
+    def total_price(self, value):
+        self._total_price = value
 
 
     def __str__(self):
@@ -93,6 +265,19 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'review_id'], name='review_keyset_idx'),
+            models.Index(fields=['listing', '-created_at'], name='review_listing_recent_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # what the database holds, so signal handlers can apply rating deltas
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         return f'Review {self.rating}/5 by {self.reviewer.username}'
 
@@ -106,10 +291,38 @@ class Payment(models.Model):
     paid = models.BooleanField(default=False)
     status = models.CharField(max_length=10, choices=PaymentChoice.choices, default=PaymentChoice.PENDING)
     txn_ref = models.CharField(max_length=100, unique=True)
+    idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    checkout_url = models.URLField(max_length=500, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'txn_id'], name='payment_keyset_idx'),
+            # pending payments due for reconciliation
+            models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+        ]
+
+    def settle(self, succeeded):
+        """
+        Record the gateway's final verdict on a pending payment. Returns False
+        when the payment had already been settled, so repeated webhook
+        deliveries and verify calls are harmless.
+        """
+        new_status = PaymentChoice.COMPLETED if succeeded else PaymentChoice.FAILED
+        with transaction.atomic():
+            updated = Payment.objects.filter(pk=self.pk, status=PaymentChoice.PENDING).update(
+                status=new_status, paid=succeeded
+            )
+            if updated and succeeded:
+                self.booking.status = BookingChoice.CONFIRMED
+                self.booking.save(update_fields=['status', 'updated_at'])
+
+        if updated:
+            self.status, self.paid = new_status, succeeded
+        else:
+            self.refresh_from_db(fields=['status', 'paid'])
+        return bool(updated)
 
     def __str__(self):
         verdict = "PAID" if self.paid else "UNPAID"
-        return f'Payment for {booking} - ({verdict})'
\ No newline at end of file
+        return f'Payment for {self.booking_id} - ({verdict})'
\ No newline at end of file
@@ -0,0 +1,158 @@
+import json
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+def keyset_filter(ordering, values):
+    """The rows strictly after ``values`` in ``ordering``."""
+    # (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ...
+    condition = Q()
+    ties = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= ties & Q(**{f'{name}__{lookup}': value})
+        ties &= Q(**{name: value})
+    return condition
+
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination that keys on every ordering field instead of only the
+    first one. The cursor stores the full ordering tuple of the last row, so a
+    page is fetched with ``WHERE (a, b) < (x, y) ORDER BY a, b LIMIT n`` and
+    costs the same however deep it is. Orderings always end in the primary
+    key so the position is unique and the offset stays at zero.
+    """
+    ordering = ('-created_at', '-pk')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        ordering = self.ordering
+        # the first ordering-aware filter backend with an opinion wins
+        for filter_cls in getattr(view, 'filter_backends', []):
+            if hasattr(filter_cls, 'get_ordering'):
+                ordering_from_filter = filter_cls().get_ordering(request, queryset, view)
+                if ordering_from_filter:
+                    ordering = ordering_from_filter
+                    break
+
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        ordering = tuple(ordering)
+        assert not any('__' in field for field in ordering), (
+            'Keyset pagination does not support double underscore lookups for orderings.'
+        )
+
+        pk_name = queryset.model._meta.pk.name
+        if ordering[-1].lstrip('-') not in ('pk', pk_name):
+            direction = '-' if ordering[-1].startswith('-') else ''
+            ordering += (direction + 'pk',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.pk_name = queryset.model._meta.pk.attname
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            position = self._decode_position(current_position, queryset)
+            queryset = queryset.filter(self._keyset_filter(ordering, position))
+
+        # Fetch one extra row to find out whether there is a following page.
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _decode_position(self, position, queryset):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # back to the ordering fields' own types, so aggregates are compared as numbers, not text
+        try:
+            return [self._ordering_field(queryset, field).to_python(value) for field, value in zip(self.ordering, values)]
+        except DjangoValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _ordering_field(self, queryset, field):
+        name = field.lstrip('-')
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        opts = queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def _keyset_filter(self, ordering, values):
+        return keyset_filter(ordering, values)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            if isinstance(instance, dict):
+                # values() rows carry the primary key under its column name
+                value = instance[self.pk_name if name == 'pk' else name]
+            else:
+                value = getattr(instance, name)
+            values.append(str(value))
+        return json.dumps(values)
+
+
+
+class UserCursorPagination(KeysetCursorPagination):
+    ordering = ('-date_joined', '-pk')
+
+
+
+class RevenueCursorPagination(KeysetCursorPagination):
+    ordering = ('-revenue', '-listing_id')
+
+    def get_ordering(self, request, queryset, view):
+        # the rows carry only the report's columns, so no other ordering has a cursor position
+        return self.ordering
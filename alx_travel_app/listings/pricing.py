@@ -0,0 +1,211 @@
+"""
+Stay pricing, shared by bookings, revenue reports and quotes.
+
+A stay is charged ``price_per_night`` for each billable night (calendar
+nights between the check-in and check-out dates, at least one), plus, for
+every PRICING_RULES rule, the rule's ``adjustment`` (a fraction of the
+nightly price, negative for discounts) for each of those nights it covers.
+Adjustments add up, so a weekend night in high season gets both.
+
+Rules are written once, as arithmetic on day numbers through a small set of
+operations (``Ops``) that either evaluates in Python or builds a SQL
+expression. ``Booking.total_price``, ``BookingQuerySet.with_total_price()``,
+``ListingQuerySet.with_revenue()`` and batch quotes therefore share one
+definition. Each stay's total is rounded to cents, half away from zero, as
+SQL's ROUND() does on every backend, so revenue adds up invoiced totals.
+
+A quote for many listings and stays is one query: rules depend on the
+dates alone, so each stay's priced nights are worked out once in Python
+and the database multiplies them by every listing's nightly price.
+"""
+import threading
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import models
+from django.db.models.functions import Floor, Greatest, Least, Round
+from django.dispatch import receiver
+
+
+# a Monday, so a day number modulo 7 is the weekday, Monday being 0
+EPOCH = date(1900, 1, 1)
+CENTS = Decimal('0.01')
+TOTAL_FIELD = models.DecimalField(max_digits=10, decimal_places=2)
+
+
+class Nights(models.Func):
+    """
+    Calendar nights between two datetime expressions (end, start), comparing
+    dates only so it agrees with ``Booking.total_price``.
+    """
+    arity = 2
+    function = 'DATEDIFF'
+    output_field = models.IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(JULIANDAY(DATE(%(expressions)s)) AS INTEGER)',
+            arg_joiner=')) - JULIANDAY(DATE(',
+            **extra_context,
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='(%(expressions)s::date)',
+            arg_joiner='::date - ',
+            **extra_context,
+        )
+
+
+def billable_nights(check_out, check_in):
+    return Greatest(Nights(check_out, check_in), models.Value(1))
+
+
+def day_number(day):
+    return (day - EPOCH).days
+
+
+def rounded_total(expression):
+    return models.ExpressionWrapper(Round(expression, 2), output_field=TOTAL_FIELD)
+
+
+
+class Ops:
+    """Arithmetic for rules, evaluated in Python."""
+    greatest = staticmethod(max)
+    least = staticmethod(min)
+
+    @staticmethod
+    def floordiv(dividend, divisor):
+        return dividend // divisor
+
+
+
+class SQLOps:
+    """Arithmetic for rules, built into SQL expressions over integer day numbers."""
+    greatest = Greatest
+    least = Least
+
+    @staticmethod
+    def floordiv(dividend, divisor):
+        return Floor(dividend / divisor, output_field=models.IntegerField())
+
+
+
+class WeekdayRule:
+    """Nights falling on ``weekdays`` (Monday is 0), e.g. ``[4, 5]`` for Friday and Saturday nights."""
+
+    def __init__(self, weekdays, adjustment):
+        self.weekdays = sorted(set(weekdays))
+        self.adjustment = Decimal(adjustment)
+
+    def nights(self, first, count, ops):
+        # nights x in [first, first + count) with x % 7 == weekday; day numbers
+        # of real stays are positive, so SQL's truncating division floors too
+        covered = 0
+        for weekday in self.weekdays:
+            covered += ops.floordiv(first + count - 1 - weekday, 7) - ops.floordiv(first - 1 - weekday, 7)
+        return covered
+
+
+
+class SeasonRule:
+    """Nights from ``start`` up to, but not including, ``end`` (ISO dates)."""
+
+    def __init__(self, start, end, adjustment):
+        self.start = day_number(date.fromisoformat(start))
+        self.end = day_number(date.fromisoformat(end))
+        self.adjustment = Decimal(adjustment)
+
+    def nights(self, first, count, ops):
+        return ops.greatest(ops.least(first + count, self.end) - ops.greatest(first, self.start), 0)
+
+
+RULES = {
+    'weekday': WeekdayRule,
+    'season': SeasonRule,
+}
+
+
+
+class Tariff:
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+
+    @classmethod
+    def from_settings(cls):
+        rules = []
+        for options in settings.PRICING_RULES:
+            options = dict(options)
+            rules.append(RULES[options.pop('kind')](**options))
+        return cls(rules)
+
+    def priced_nights(self, first, count, ops=Ops):
+        """Billable nights weighted by the rules, for ``count`` nights from day number ``first``."""
+        weighted = count
+        for rule in self.rules:
+            weighted = weighted + rule.adjustment * rule.nights(first, count, ops)
+        return weighted
+
+    def stay_nights(self, check_in, check_out):
+        """``(billable nights, priced nights)`` of a stay between two dates."""
+        count = max((check_out - check_in).days, 1)
+        return count, self.priced_nights(day_number(check_in), count)
+
+    def total(self, price_per_night, check_in, check_out):
+        _, priced = self.stay_nights(check_in, check_out)
+        return (price_per_night * priced).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+    def total_expression(self, price_per_night, check_in, check_out):
+        """``total()`` as a SQL expression over the named fields."""
+        count = billable_nights(check_out, check_in)
+        priced = count
+        if self.rules:
+            first = Nights(check_in, models.Value(EPOCH))
+            priced = self.priced_nights(first, count, SQLOps)
+        return rounded_total(models.F(price_per_night) * priced)
+
+
+_tariff = None
+_tariff_lock = threading.Lock()
+
+
+def get_tariff():
+    """The process-wide tariff built from PRICING_RULES."""
+    global _tariff
+    if _tariff is None:
+        with _tariff_lock:
+            if _tariff is None:
+                _tariff = Tariff.from_settings()
+    return _tariff
+
+
+@receiver(setting_changed)
+def reset_tariff(setting, **kwargs):
+    global _tariff
+    if setting == 'PRICING_RULES':
+        with _tariff_lock:
+            _tariff = None
+
+
+def quote(listings, stays):
+    """
+    Totals for every listing in ``listings`` (a queryset) and every
+    ``(check_in, check_out)`` date pair in ``stays``, in one query.
+    Returns ``{pk: [total per stay]}`` in the queryset's order.
+    """
+    tariff = get_tariff()
+    names = []
+    annotations = {}
+    for position, (check_in, check_out) in enumerate(stays):
+        _, priced = tariff.stay_nights(check_in, check_out)
+        names.append(f'quote_{position}')
+        annotations[names[-1]] = rounded_total(
+            models.F('price_per_night') * models.Value(Decimal(priced), output_field=models.DecimalField())
+        )
+    rows = listings.annotate(**annotations).values_list('pk', *names)
+    # already rounded; SQLite hands computed decimals back without a fixed exponent
+    return {pk: [total.quantize(CENTS) for total in totals] for pk, *totals in rows}
@@ -1,11 +1,89 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from .models import User, Listing, Booking, Review, Payment
+from rest_framework.permissions import SAFE_METHODS
+from .models import User, Listing, Booking, Review, Payment, ACTIVE_BOOKING_STATUSES
 from datetime import datetime
 
+BOOKING_OVERLAP_ERROR = 'The listing is already booked for some of these dates'
 
 
-class BookingSerializer(serializers.ModelSerializer):
+def requested_expansions(request):
+    """Names passed in ``?expand=a,b`` on the current request."""
+    if request is None:
+        return set()
+    value = request.query_params.get('expand', '')
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def requested_fields(request):
+    """Names passed in ``?fields=a,b``, or None when the response should not be trimmed."""
+    if request is None or request.method not in SAFE_METHODS or 'fields' not in request.query_params:
+        return None
+    value = request.query_params['fields']
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+
+class DynamicFieldsMixin:
+    """
+    On reads, ``?fields=a,b`` trims the representation to the named fields
+    and ``?expand=x`` swaps in the nested serializer ``expandable_fields``
+    declares for ``x``. Expanded fields are kept whatever ``fields`` says;
+    unknown names are ignored.
+    """
+    # expand name -> (field name, factory returning the nested serializer)
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        expanded = set()
+        for name in requested_expansions(request) & self.expandable_fields.keys():
+            field_name, factory = self.expandable_fields[name]
+            self.fields[field_name] = factory()
+            expanded.add(field_name)
+
+        fields = requested_fields(request)
+        if fields is not None:
+            for name in list(self.fields):
+                if name not in fields and name not in expanded:
+                    self.fields.pop(name)
+
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves the pk from ``context['related_objects'][model]`` when a bulk
+    request has fetched every referenced row up front, instead of one query
+    per item.
+    """
+    def to_internal_value(self, data):
+        model = self.get_queryset().model
+        prefetched = self.context.get('related_objects', {}).get(model)
+        if prefetched is None:
+            return super().to_internal_value(data)
+        try:
+            pk = model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in prefetched:
+            self.fail('does_not_exist', pk_value=data)
+        return prefetched[pk]
+
+
+
+class BookingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+    expandable_fields = {
+        'listing': ('listing', lambda: ListingSerializer(read_only=True)),
+        'traveler': ('traveler', lambda: UserSerializer(read_only=True)),
+    }
     total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     check_in = serializers.DateTimeField(input_formats=['%d/%m/%Y'], format="%d/%m/%Y")
     check_out = serializers.DateTimeField(input_formats=['%d/%m/%Y'], format="%d/%m/%Y")
@@ -19,9 +97,68 @@ class BookingSerializer(serializers.ModelSerializer):
             raise ValidationError({'detail': 'The number of travelers must be greater than 0'})
         return value
 
+    def validate(self, attrs):
+        check_in = attrs.get('check_in', getattr(self.instance, 'check_in', None))
+        check_out = attrs.get('check_out', getattr(self.instance, 'check_out', None))
+        if check_in and check_out and check_out <= check_in:
+            raise ValidationError({'detail': 'Check-out must be after check-in'})
+        return attrs
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            self.reserve(validated_data)
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            self.reserve(validated_data, instance)
+            return super().update(instance, validated_data)
+
+    def reserve(self, validated_data, instance=None):
+        """Reject the booking if it overlaps another active one, holding the listing's lock."""
+        def current(field):
+            return validated_data.get(field, getattr(instance, field, None))
+
+        if current('status') not in ACTIVE_BOOKING_STATUSES:
+            return
+        listing = current('listing')
+        Listing.objects.lock([listing.pk])
+        clashes = Booking.objects.filter(listing=listing).overlapping(current('check_in'), current('check_out'))
+        if instance is not None:
+            clashes = clashes.exclude(pk=instance.pk)
+        if clashes.exists():
+            raise ValidationError({'detail': BOOKING_OVERLAP_ERROR})
+
+
+
+class BookingFilterSerializer(serializers.Serializer):
+    min_total_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_total_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+
+
 
+class ListingFilterSerializer(serializers.Serializer):
+    min_rating = serializers.DecimalField(max_digits=3, decimal_places=2, min_value=0, max_value=5, required=False)
 
-class UserSerializer(serializers.ModelSerializer):
+
+
+class ListingProximitySerializer(serializers.Serializer):
+    near = serializers.CharField()
+    radius = serializers.FloatField(min_value=0, required=False)
+    k = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+    def validate_near(self, value):
+        try:
+            lat, lng = (float(part) for part in value.split(','))
+        except ValueError:
+            raise ValidationError({'detail': 'near must be given as "latitude,longitude"'})
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValidationError({'detail': 'near is outside the valid latitude/longitude range'})
+        return lat, lng
+
+
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(min_length=8, max_length=50, write_only=True)
     #bookings = BookingSerializer(many=True, read_only=True)
     class Meta:
@@ -31,20 +168,46 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 
-class ListingSerializer(serializers.ModelSerializer):
-    bookings = BookingSerializer(many=True, read_only=True)
+class ListingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+    booking_count = serializers.IntegerField(read_only=True)
+    # km from ?near=, only present on proximity searches
+    distance = serializers.FloatField(read_only=True)
+    expandable_fields = {
+        # the view prefetches at most RECENT_BOOKINGS_LIMIT of them
+        'bookings': ('recent_bookings', lambda: BookingSerializer(many=True, read_only=True)),
+        'agent': ('agent', lambda: UserSerializer(read_only=True)),
+    }
+
     class Meta:
         model = Listing
-        fields = '__all__'
+        # geohash and rating_total are denormalised for lookups, not part of the API
+        fields = (
+            'listing_id', 'booking_count', 'distance', 'title', 'description', 'location', 'price_per_night',
+            'max_guests', 'latitude', 'longitude', 'rating_avg', 'review_count', 'created_at', 'updated_at', 'agent',
+        )
+        read_only_fields = ('rating_avg', 'review_count')
 
     def validate_max_guests(self, value):
         if value <= 0:
             raise ValidationError({'detail': 'The maximum number of guest must be greater than 0'})
         return value
 
+    def validate(self, attrs):
+        latitude = attrs.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = attrs.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise ValidationError({'detail': 'latitude and longitude must be given together'})
+        return attrs
+
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'listing': ('listing', lambda: ListingSerializer(read_only=True)),
+        'reviewer': ('reviewer', lambda: UserSerializer(read_only=True)),
+    }
+
     class Meta:
         model = Review
         fields = '__all__'
@@ -60,4 +223,48 @@ class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = ('txn_id', 'booking', 'amount', 'gateway', 'paid', 'status', 'txn_ref')
-        read_only_fields = ('txn_ref', 'paid', 'status')
\ No newline at end of file
+        read_only_fields = ('txn_ref', 'paid', 'status')
+
+
+class ListingAvailabilitySerializer(serializers.Serializer):
+    check_in = serializers.DateTimeField(input_formats=['%d/%m/%Y'])
+    check_out = serializers.DateTimeField(input_formats=['%d/%m/%Y'])
+    location = serializers.CharField(max_length=100, required=False)
+    guests = serializers.IntegerField(min_value=1, required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+
+    def validate(self, attrs):
+        if attrs['check_out'] <= attrs['check_in']:
+            raise ValidationError({'detail': 'Check-out must be after check-in'})
+        if 'min_price' in attrs and 'max_price' in attrs and attrs['min_price'] > attrs['max_price']:
+            raise ValidationError({'detail': 'min_price cannot be greater than max_price'})
+        return attrs
+
+
+
+class StaySerializer(serializers.Serializer):
+    check_in = serializers.DateField(input_formats=['%d/%m/%Y'], format='%d/%m/%Y')
+    check_out = serializers.DateField(input_formats=['%d/%m/%Y'], format='%d/%m/%Y')
+
+    def validate(self, attrs):
+        if attrs['check_out'] <= attrs['check_in']:
+            raise ValidationError({'detail': 'Check-out must be after check-in'})
+        return attrs
+
+
+
+class ListingQuoteSerializer(serializers.Serializer):
+    listings = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    stays = StaySerializer(many=True, allow_empty=False)
+
+    def validate_listings(self, value):
+        if len(value) > settings.QUOTE_MAX_LISTINGS:
+            raise ValidationError({'detail': f'At most {settings.QUOTE_MAX_LISTINGS} listings can be quoted at once.'})
+        # first mention wins, keeping the caller's order
+        return list(dict.fromkeys(value))
+
+    def validate_stays(self, value):
+        if len(value) > settings.QUOTE_MAX_STAYS:
+            raise ValidationError({'detail': f'At most {settings.QUOTE_MAX_STAYS} stays can be quoted at once.'})
+        return value
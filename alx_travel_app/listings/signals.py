@@ -0,0 +1,72 @@
+from django.db.models.signals import post_delete, post_save
+from django.db.models.base import DEFERRED
+from django.dispatch import receiver
+from .cache import invalidate_on_commit
+from .models import User, Listing, Booking, Review
+from .search import index_listings
+
+
+# Queryset update()/bulk_create() do not send these signals; callers using
+# them must invalidate the catalogue themselves.
+
+@receiver([post_save, post_delete], sender=Listing)
+def listing_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_listings([instance])
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def booking_changed(sender, instance, raw=False, **kwargs):
+    # a listing's representation counts its bookings, so its ETag has to move with them
+    if not raw:
+        Listing.objects.touch([instance.listing_id])
+
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_values', {})
+    if created:
+        Listing.objects.adjust_rating(instance.listing_id, instance.rating, 1)
+    elif previous.get('rating', DEFERRED) is DEFERRED or previous.get('listing_id', DEFERRED) is DEFERRED:
+        # saved without loading first; fall back to recounting this listing
+        Listing.objects.rebuild_ratings([instance.listing_id])
+    elif previous['listing_id'] != instance.listing_id:
+        Listing.objects.adjust_rating(previous['listing_id'], -previous['rating'], -1)
+        Listing.objects.adjust_rating(instance.listing_id, instance.rating, 1)
+    elif previous['rating'] != instance.rating:
+        Listing.objects.adjust_rating(instance.listing_id, instance.rating - previous['rating'], 0)
+    instance._loaded_values = {'listing_id': instance.listing_id, 'rating': instance.rating}
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    rating = getattr(instance, '_loaded_values', {}).get('rating', DEFERRED)
+    if rating is DEFERRED:
+        rating = instance.rating
+    Listing.objects.adjust_rating(instance.listing_id, -rating, -1)
+
+
+# connected after the rating and touch receivers, so outside a transaction
+# the tokens still move only once the listing's aggregates are written
+@receiver([post_save, post_delete], sender=Booking)
+@receiver([post_save, post_delete], sender=Review)
+def listing_child_changed(sender, instance, **kwargs):
+    invalidate_on_commit([instance.listing_id])
+
+
+@receiver(post_save, sender=User)
+def agent_changed(sender, instance, update_fields=None, raw=False, **kwargs):
+    # listings embed their agent under ?expand=agent; logins only touch last_login, which is never shown
+    if raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    listing_ids = list(Listing.objects.filter(agent_id=instance.pk).values_list('pk', flat=True))
+    if listing_ids:
+        invalidate_on_commit(listing_ids)
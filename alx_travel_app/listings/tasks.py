@@ -0,0 +1,73 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from celery import group, shared_task
+from django.conf import settings
+from django.utils import timezone
+from .gateways import GatewayError, get_gateway
+from .models import Payment, PaymentChoice
+
+
+logger = logging.getLogger(__name__)
+
+
+
+@shared_task
+def reconcile_pending_payments():
+    """Fan pending payments that the webhook has not settled out to verify_payment_batch."""
+    cutoff = timezone.now() - settings.PAYMENT_RECONCILE_AFTER
+    txn_refs = list(
+        Payment.objects.filter(status=PaymentChoice.PENDING, created_at__lte=cutoff)
+        .values_list('txn_ref', flat=True)
+    )
+    size = settings.PAYMENT_RECONCILE_BATCH_SIZE
+    batches = [txn_refs[i:i + size] for i in range(0, len(txn_refs), size)]
+    if batches:
+        group(verify_payment_batch.s(batch) for batch in batches).apply_async()
+    return len(txn_refs)
+
+
+
+def _verify(txn_ref):
+    try:
+        return txn_ref, True, get_gateway().verify(txn_ref)
+    except GatewayError:
+        return txn_ref, False, None
+
+
+@shared_task(bind=True, max_retries=5)
+def verify_payment_batch(self, txn_refs):
+    """
+    Verify a batch of pending payments against the gateway.
+
+    The gateway calls run concurrently on a small thread pool sharing the
+    pooled gateway session; the database writes stay on the task's own thread.
+    Payments the gateway could not be asked about are retried with
+    exponential backoff, and payments still unpaid after
+    PAYMENT_STALE_AFTER are marked failed.
+    """
+    payments = {
+        payment.txn_ref: payment
+        for payment in Payment.objects.select_related('booking').filter(
+            txn_ref__in=txn_refs, status=PaymentChoice.PENDING
+        )
+    }
+    if not payments:
+        return 0
+
+    stale_before = timezone.now() - settings.PAYMENT_STALE_AFTER
+    unreachable = []
+    settled = 0
+    with ThreadPoolExecutor(max_workers=settings.PAYMENT_RECONCILE_CONCURRENCY) as pool:
+        for txn_ref, reached, succeeded in pool.map(_verify, payments):
+            payment = payments[txn_ref]
+            if not reached:
+                unreachable.append(txn_ref)
+            elif succeeded is None and payment.created_at < stale_before:
+                settled += payment.settle(False)
+            elif succeeded is not None:
+                settled += payment.settle(succeeded)
+
+    if unreachable:
+        logger.warning('gateway unreachable for %d payments, retrying', len(unreachable))
+        raise self.retry(args=(unreachable,), countdown=30 * 2 ** self.request.retries)
+    return settled
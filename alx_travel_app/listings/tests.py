@@ -1,3 +1,1316 @@
-from django.test import TestCase
+import asyncio
+import csv
+import hashlib
+import hmac
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from decimal import Decimal, ROUND_HALF_UP
+from unittest import mock
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from .models import User, Listing, Booking, Review, Payment, BookingChoice, PaymentChoice, RoleChoice
+from .chapa import get_async_client, get_client
+from .chapa_stub import ChapaStubServer
+from .gateways import get_gateway
+from . import geo, pricing
+from .tasks import reconcile_pending_payments
+from .middleware import metrics
+from .views import BookingViewSet, PaymentListAPIView
+from .management.commands.benchmark import percentile, summarize
+from alx_travel_app.celery import app as celery_app
 
-# Create your tests here.
+
+def make_user(username, role=RoleChoice.TRAVELER):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password='password123',
+        first_name=username.title(),
+        last_name='Test',
+        role=role,
+    )
+
+
+def make_listing(agent, **overrides):
+    fields = {
+        'title': 'Kigali Hills Cottage',
+        'description': 'Quiet cottage on the hills',
+        'location': 'Kigali, Rwanda',
+        'price_per_night': Decimal('65.00'),
+        'max_guests': 4,
+    }
+    fields.update(overrides)
+    return Listing.objects.create(agent=agent, **fields)
+
+
+def make_booking(traveler, listing, check_in, check_out, status=BookingChoice.CONFIRMED):
+    return Booking.objects.create(
+        traveler=traveler,
+        listing=listing,
+        num_of_traveler=1,
+        check_in=check_in,
+        check_out=check_out,
+        status=status,
+    )
+
+
+def day(d):
+    return timezone.make_aware(datetime(2026, 1, d))
+
+
+def results(response):
+    return response.data['results'] if 'results' in response.data else response.data
+
+
+
+class ListingAvailabilityTests(APITestCase):
+    def setUp(self):
+        self.agent = make_user('agent', RoleChoice.AGENT)
+        self.traveler = make_user('traveler')
+        self.booked = make_listing(self.agent, title='Booked')
+        self.cancelled = make_listing(self.agent, title='Cancelled booking')
+        self.free = make_listing(self.agent, title='Free', max_guests=2)
+        make_booking(self.traveler, self.booked, day(10), day(14))
+        make_booking(self.traveler, self.cancelled, day(10), day(14), status=BookingChoice.CANCELLED)
+        self.url = reverse('listings:listing-view-available')
+
+    def titles(self, response):
+        return sorted(item['title'] for item in results(response))
+
+    def test_excludes_listings_with_overlapping_active_bookings(self):
+        response = self.client.get(self.url, {'check_in': '12/01/2026', 'check_out': '16/01/2026'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.titles(response), ['Cancelled booking', 'Free'])
+
+    def test_back_to_back_stay_is_available(self):
+        response = self.client.get(self.url, {'check_in': '14/01/2026', 'check_out': '16/01/2026'})
+        self.assertEqual(self.titles(response), ['Booked', 'Cancelled booking', 'Free'])
+
+    def test_filters_guests_and_price(self):
+        response = self.client.get(self.url, {
+            'check_in': '01/02/2026', 'check_out': '03/02/2026', 'guests': 3, 'max_price': '100',
+        })
+        self.assertEqual(self.titles(response), ['Booked', 'Cancelled booking'])
+
+    def test_rejects_inverted_range(self):
+        response = self.client.get(self.url, {'check_in': '16/01/2026', 'check_out': '12/01/2026'})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class ListingRepresentationTests(APITestCase):
+    def setUp(self):
+        # the catalogue cache is invalidated on commit, which a TestCase never reaches
+        caches['listings'].clear()
+        self.agent = make_user('agent', RoleChoice.AGENT)
+        self.traveler = make_user('traveler')
+        for n in range(3):
+            listing = make_listing(self.agent, title=f'Listing {n}')
+            for d in range(1, 8):
+                make_booking(self.traveler, listing, day(d * 2), day(d * 2 + 1))
+        self.url = reverse('listings:listing-view-list')
+
+    def test_list_sends_counts_not_booking_history(self):
+        # the ETag aggregate, then the page
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        for item in results(response):
+            self.assertEqual(item['booking_count'], 7)
+            self.assertNotIn('recent_bookings', item)
+
+    def test_expand_prefetches_bounded_recent_bookings(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'expand': 'bookings'})
+        for item in results(response):
+            self.assertEqual(len(item['recent_bookings']), 5)
+
+    def test_denormalised_columns_stay_internal(self):
+        item = results(self.client.get(self.url))[0]
+        self.assertIn('rating_avg', item)
+        self.assertNotIn('rating_total', item)
+        self.assertNotIn('geohash', item)
+        item = results(self.client.get(self.url, {'fields': 'title,rating_total,geohash'}))[0]
+        self.assertEqual(set(item), {'title'})
+
+
+
+class BookingTotalPriceTests(APITestCase):
+    def setUp(self):
+        self.agent = make_user('agent', RoleChoice.AGENT)
+        self.traveler = make_user('traveler')
+        self.listing = make_listing(self.agent, price_per_night=Decimal('65.50'))
+        self.short = make_booking(self.traveler, self.listing, day(3) + timedelta(hours=14), day(3) + timedelta(hours=20))
+        self.long = make_booking(self.traveler, self.listing, day(5) + timedelta(hours=23), day(9) + timedelta(hours=1))
+        make_booking(self.traveler, self.listing, day(20), day(22), status=BookingChoice.CANCELLED)
+
+    def test_annotation_matches_python_property(self):
+        for booking in Booking.objects.with_total_price():
+            self.assertEqual(booking.total_price, Booking.objects.get(pk=booking.pk).total_price)
+        self.assertEqual(Booking.objects.with_total_price().get(pk=self.short.pk).total_price, Decimal('65.50'))
+        self.assertEqual(Booking.objects.with_total_price().get(pk=self.long.pk).total_price, Decimal('262.00'))
+
+    def test_list_filters_on_total_price_without_per_row_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('listings:booking-view-list'), {'min_total_price': '200'})
+        self.assertEqual([item['booking_id'] for item in results(response)], [str(self.long.pk)])
+
+    def test_revenue_counts_confirmed_bookings_only(self):
+        listing = Listing.objects.with_revenue().get(pk=self.listing.pk)
+        self.assertEqual(listing.revenue, Decimal('327.50'))
+        response = self.client.get(reverse('listings:listing-view-revenue'))
+        self.assertEqual(results(response)[0]['confirmed_bookings'], 2)
+
+    def test_revenue_keeps_its_ordering(self):
+        make_listing(self.agent, title='Unbooked', price_per_night=Decimal('500.00'))
+        url = reverse('listings:listing-view-revenue')
+        response = self.client.get(url, {'ordering': 'price_per_night', 'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['revenue'] for row in results(response)], [Decimal('327.50')])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['revenue'] for row in results(response)], [Decimal('0.00')])
+
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        agent = make_user('agent', RoleChoice.AGENT)
+        for n in range(7):
+            make_listing(agent, title=f'Listing {n}')
+        # identical timestamps force the primary key tiebreaker to do the work
+        Listing.objects.update(created_at=day(1))
+        self.url = reverse('listings:listing-view-list')
+
+    def walk(self, url, direction):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['listing_id'] for item in response.data['results'])
+            url = response.data[direction]
+        return seen
+
+    def test_walks_every_row_once_across_tied_timestamps(self):
+        forward = self.walk(self.url + '?page_size=3', 'next')
+        self.assertEqual(len(forward), 7)
+        self.assertEqual(len(set(forward)), 7)
+
+        response = self.client.get(self.url + '?page_size=3')
+        last_page = self.client.get(self.client.get(response.data['next']).data['next'])
+        backward = self.walk(last_page.data['previous'], 'previous')
+        self.assertEqual(len(backward), 6)
+        self.assertEqual(set(backward) | set(item['listing_id'] for item in last_page.data['results']), set(forward))
+
+    def test_rejects_tampered_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'cD1ub3Rqc29u'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_walks_every_listing_once_by_revenue(self):
+        # seeded revenues are sums of many totals, which SQLite adds up as floats
+        call_command('seed', stdout=StringIO(), listings=60, bookings=600)
+        # one row a page, so every listing's revenue is used as a cursor position
+        url = reverse('listings:listing-view-revenue') + '?page_size=1'
+        total = Listing.objects.count()
+        seen = []
+        revenues = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['listing_id'] for item in response.data['results'])
+            revenues.extend(item['revenue'] for item in response.data['results'])
+            # a row repeated at a page boundary would page forever
+            self.assertLessEqual(len(seen), total)
+            url = response.data['next']
+        self.assertEqual(len(seen), total)
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertEqual(revenues, sorted(revenues, reverse=True))
+        self.assertTrue(all(revenue.as_tuple().exponent == -2 for revenue in revenues))
+
+
+
+class ChapaGatewayTests(APITestCase):
+    def setUp(self):
+        self.stub = ChapaStubServer().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(CHAPA_BASE_URL=self.stub.url, CHAPA_READ_TIMEOUT=0.2, CHAPA_MAX_RETRIES=1)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        traveler = make_user('traveler')
+        listing = make_listing(make_user('agent', RoleChoice.AGENT))
+        self.booking = make_booking(traveler, listing, day(3), day(5), status=BookingChoice.PENDING)
+
+    def test_initiate_then_verify_through_pooled_client(self):
+        response = self.client.post(reverse('chapa-initiate'), {'booking_id': str(self.booking.pk)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        txn_ref = response.data['payment']['txn_ref']
+        self.assertEqual(self.stub.calls[0][1]['amount'], '130.00')
+
+        response = self.client.post(reverse('chapa-verify'), {'txn_ref': txn_ref}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Payment.objects.get(txn_ref=txn_ref).status, PaymentChoice.COMPLETED)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, BookingChoice.CONFIRMED)
+        self.assertEqual(get_client().stats.snapshot()['verify']['calls'], 1)
+
+    def test_idempotency_key_replays_without_calling_gateway(self):
+        url = reverse('chapa-initiate')
+        data = {'booking_id': str(self.booking.pk)}
+        first = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        second = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['payment']['txn_ref'], first.data['payment']['txn_ref'])
+        self.assertEqual(second.data['checkout_url'], first.data['checkout_url'])
+        self.assertEqual(len(self.stub.calls), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def store_elsewhere(self, key):
+        # what another request with the same key stored after this one looked it up
+        Payment.objects.create(
+            booking=self.booking, amount=Decimal('130.00'), gateway='Chapa', txn_ref='txn-first',
+            idempotency_key=key, checkout_url='https://checkout.example/first',
+        )
+
+    def initiate(self, key):
+        return self.client.post(
+            reverse('chapa-initiate'), {'booking_id': str(self.booking.pk)}, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def assertReplayedFirst(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.data['payment']['txn_ref'], 'txn-first')
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_retry_taking_the_lock_late_replays_the_stored_payment(self):
+        add = cache.add
+
+        def add_once_the_first_request_is_done(*args, **kwargs):
+            self.store_elsewhere('retry-2')
+            return add(*args, **kwargs)
+
+        with mock.patch.object(cache, 'add', side_effect=add_once_the_first_request_is_done):
+            response = self.initiate('retry-2')
+        self.assertReplayedFirst(response)
+        self.assertEqual(self.stub.calls, [])
+
+    def test_key_stored_during_the_gateway_call_is_replayed(self):
+        # the lock expired under a slow first request, which stored its payment while we called the gateway
+        gateway = get_gateway()
+        initialize = gateway.initialize
+
+        def initialize_while_the_first_request_stores(*args, **kwargs):
+            url = initialize(*args, **kwargs)
+            self.store_elsewhere('retry-3')
+            return url
+
+        with mock.patch.object(gateway, 'initialize', side_effect=initialize_while_the_first_request_stores):
+            response = self.initiate('retry-3')
+        self.assertReplayedFirst(response)
+
+    def test_malformed_booking_id_is_not_found(self):
+        response = self.client.post(reverse('chapa-initiate'), {'booking_id': 'nope'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.stub.calls, [])
+
+    def test_concurrent_initiation_for_same_booking_is_refused(self):
+        cache.add(f'chapa-initiate:{self.booking.pk}', 'other-request')
+        self.addCleanup(cache.delete, f'chapa-initiate:{self.booking.pk}')
+        response = self.client.post(reverse('chapa-initiate'), {'booking_id': str(self.booking.pk)}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.stub.calls, [])
+
+    def test_slow_gateway_is_cut_off_by_read_timeout(self):
+        self.stub.delay = 0.5
+        response = self.client.post(reverse('chapa-initiate'), {'booking_id': str(self.booking.pk)}, format='json')
+        self.assertEqual(response.status_code, 502)
+        # a timed-out initialize is not retried, so the gateway saw it once
+        self.assertEqual(len(self.stub.calls), 1)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_metrics_report_gateway_latency(self):
+        # async calls run on a loop of their own per request here, and still count
+        response = self.client.post(reverse('chapa-initiate-async'), {'booking_id': str(self.booking.pk)}, format='json')
+        self.client.post(reverse('chapa-verify'), {'txn_ref': response.json()['payment']['txn_ref']}, format='json')
+        admin = make_user('admin')
+        admin.is_staff = True
+        admin.save()
+        self.client.force_authenticate(admin)
+        gateway = self.client.get(reverse('request-metrics')).data['gateway']
+        self.assertEqual(gateway['name'], 'Chapa')
+        self.assertEqual({name: stats['calls'] for name, stats in gateway['operations'].items()}, {'initialize': 1, 'verify': 1})
+        self.assertGreater(gateway['operations']['verify']['max_ms'], 0)
+
+
+
+class AsyncChapaGatewayTests(APITestCase):
+    def setUp(self):
+        self.stub = ChapaStubServer().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(CHAPA_BASE_URL=self.stub.url, CHAPA_READ_TIMEOUT=0.5, CHAPA_MAX_RETRIES=1)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.traveler = make_user('traveler')
+        self.listing = make_listing(make_user('agent', RoleChoice.AGENT))
+        self.booking = make_booking(self.traveler, self.listing, day(3), day(5), status=BookingChoice.PENDING)
+
+    def test_initiate_then_verify(self):
+        url = reverse('chapa-initiate-async')
+        response = self.client.post(url, {'booking_id': str(self.booking.pk)}, format='json', HTTP_IDEMPOTENCY_KEY='a-1')
+        self.assertEqual(response.status_code, 200)
+        txn_ref = response.json()['payment']['txn_ref']
+        self.assertEqual(self.stub.calls[0][1]['amount'], '130.00')
+
+        replay = self.client.post(url, {'booking_id': str(self.booking.pk)}, format='json', HTTP_IDEMPOTENCY_KEY='a-1')
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(self.stub.calls), 1)
+
+        response = self.client.post(reverse('chapa-verify-async'), {'txn_ref': txn_ref}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['payment']['status'], PaymentChoice.COMPLETED)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, BookingChoice.CONFIRMED)
+
+    def test_retry_taking_the_lock_late_replays_the_stored_payment(self):
+        aadd = cache.aadd
+
+        async def aadd_once_the_first_request_is_done(*args, **kwargs):
+            await Payment.objects.acreate(
+                booking=self.booking, amount=Decimal('130.00'), gateway='Chapa', txn_ref='txn-first',
+                idempotency_key='a-2', checkout_url='https://checkout.example/first',
+            )
+            return await aadd(*args, **kwargs)
+
+        with mock.patch.object(cache, 'aadd', side_effect=aadd_once_the_first_request_is_done):
+            response = self.client.post(
+                reverse('chapa-initiate-async'), {'booking_id': str(self.booking.pk)}, format='json', HTTP_IDEMPOTENCY_KEY='a-2'
+            )
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.json()['payment']['txn_ref'], 'txn-first')
+        self.assertEqual(self.stub.calls, [])
+
+    def test_unknown_booking_and_bad_body(self):
+        url = reverse('chapa-initiate-async')
+        self.assertEqual(self.client.post(url, {'booking_id': 'nope'}, format='json').status_code, 404)
+        self.assertEqual(self.client.post(url, 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.stub.calls, [])
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+    async def test_verify_calls_overlap_on_one_event_loop(self):
+        payments = []
+        for n in range(10):
+            payments.append(await Payment.objects.acreate(
+                booking=self.booking, amount=Decimal('130.00'), gateway='Chapa', txn_ref=f'async-{n}'
+            ))
+        self.stub.delay = 0.2
+        client = AsyncClient()
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post(reverse('chapa-verify-async'), {'txn_ref': payment.txn_ref}, content_type='application/json')
+            for payment in payments
+        ])
+        elapsed = time.perf_counter() - started
+        self.assertEqual({response.status_code for response in responses}, {200})
+        # each request counts its own queries on the ORM's shared thread, not its neighbours'
+        counts = {re.search(r'"(\d+) queries', response['Server-Timing']).group(1) for response in responses}
+        # the lookup, then settle() in a savepoint: payment update, booking fetch and save, listing touch
+        self.assertEqual(counts, {'7'})
+        # ten 200ms gateway calls, in flight together
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(get_async_client().stats.snapshot()['verify']['calls'], 10)
+        await get_async_client().aclose()
+
+
+@override_settings(CHAPA_WEBHOOK_SECRET='whsec-test')
+class ChapaWebhookTests(APITestCase):
+    def setUp(self):
+        traveler = make_user('traveler')
+        listing = make_listing(make_user('agent', RoleChoice.AGENT))
+        self.booking = make_booking(traveler, listing, day(3), day(5), status=BookingChoice.PENDING)
+        self.payment = Payment.objects.create(
+            booking=self.booking, amount=Decimal('130.00'), gateway='Chapa', txn_ref='txn-1'
+        )
+
+    def deliver(self, payload, secret='whsec-test'):
+        body = json.dumps(payload).encode()
+        signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return self.client.post(
+            reverse('chapa-webhook'), body, content_type='application/json', HTTP_CHAPA_SIGNATURE=signature
+        )
+
+    def test_success_event_settles_payment_once(self):
+        event = {'event': 'charge.success', 'tx_ref': 'txn-1', 'status': 'success'}
+        self.assertEqual(self.deliver(event).status_code, 200)
+        self.assertEqual(self.deliver(event).status_code, 200)
+        self.deliver(dict(event, status='failed'))
+
+        self.payment.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.paid), (PaymentChoice.COMPLETED, True))
+        self.assertEqual(self.booking.status, BookingChoice.CONFIRMED)
+
+    def test_rejects_bad_signature(self):
+        response = self.deliver({'tx_ref': 'txn-1', 'status': 'success'}, secret='wrong')
+        self.assertEqual(response.status_code, 401)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, PaymentChoice.PENDING)
+
+
+
+SIMULATOR = {'latency': 0, 'settle_after': 0, 'webhooks': False, 'seed': 7}
+
+
+@override_settings(PAYMENT_GATEWAY='simulator', PAYMENT_SIMULATOR=SIMULATOR, CHAPA_WEBHOOK_SECRET='whsec-test')
+class SimulatedGatewayTests(APITestCase):
+    def setUp(self):
+        traveler = make_user('traveler')
+        listing = make_listing(make_user('agent', RoleChoice.AGENT))
+        self.booking = make_booking(traveler, listing, day(3), day(5), status=BookingChoice.PENDING)
+
+    def initiate(self):
+        return self.client.post(reverse('chapa-initiate'), {'booking_id': str(self.booking.pk)}, format='json')
+
+    @override_settings(PAYMENT_SIMULATOR=dict(SIMULATOR, webhooks=True))
+    def test_signed_webhook_settles_the_payment(self):
+        delivered = []
+        arrived = threading.Event()
+
+        def deliver(url, body, headers):
+            delivered.append((url, body, headers))
+            arrived.set()
+        get_gateway().deliver = deliver
+
+        response = self.initiate()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['payment']['gateway'], 'Simulator')
+        self.assertTrue(arrived.wait(5))
+
+        url, body, headers = delivered[0]
+        self.assertTrue(url.endswith(reverse('chapa-webhook')))
+        response = self.client.post(
+            reverse('chapa-webhook'), body, content_type='application/json',
+            HTTP_CHAPA_SIGNATURE=headers['Chapa-Signature'],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, BookingChoice.CONFIRMED)
+
+    @override_settings(PAYMENT_SIMULATOR=dict(SIMULATOR, decline_rate=1))
+    def test_declined_payment_is_failed_on_verify(self):
+        txn_ref = self.initiate().data['payment']['txn_ref']
+        response = self.client.post(reverse('chapa-verify'), {'txn_ref': txn_ref}, format='json')
+        self.assertEqual(response.data['payment']['status'], PaymentChoice.FAILED)
+
+    @override_settings(PAYMENT_SIMULATOR=dict(SIMULATOR, settle_after=60))
+    def test_payment_stays_pending_until_it_settles(self):
+        txn_ref = self.initiate().data['payment']['txn_ref']
+        response = self.client.post(reverse('chapa-verify'), {'txn_ref': txn_ref}, format='json')
+        self.assertEqual(response.data['payment']['status'], PaymentChoice.PENDING)
+
+    @override_settings(PAYMENT_SIMULATOR=dict(SIMULATOR, failure_rate=1))
+    def test_gateway_failures_surface_as_502(self):
+        self.assertEqual(self.initiate().status_code, 502)
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(get_gateway().stats.snapshot()['initialize']['errors'], 1)
+
+
+class PaymentReconciliationTests(APITestCase):
+    def setUp(self):
+        self.stub = ChapaStubServer().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(CHAPA_BASE_URL=self.stub.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # settings are namespaced, so the CELERY_ key is the one celery reads
+        celery_app.conf.CELERY_TASK_ALWAYS_EAGER = True
+        self.addCleanup(setattr, celery_app.conf, 'CELERY_TASK_ALWAYS_EAGER', False)
+
+        traveler = make_user('traveler')
+        listing = make_listing(make_user('agent', RoleChoice.AGENT))
+        self.payments = []
+        for n, age in enumerate([timedelta(hours=1), timedelta(hours=2), timedelta(days=2), timedelta(minutes=1)]):
+            booking = make_booking(traveler, listing, day(n + 1), day(n + 2), status=BookingChoice.PENDING)
+            payment = Payment.objects.create(booking=booking, amount=Decimal('65.00'), gateway='Chapa', txn_ref=f'txn-{n}')
+            Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - age)
+            self.payments.append(payment)
+
+    def statuses(self):
+        return [Payment.objects.get(pk=payment.pk).status for payment in self.payments]
+
+    def test_settles_pending_payments_in_batches(self):
+        with self.settings(PAYMENT_RECONCILE_BATCH_SIZE=2):
+            self.assertEqual(reconcile_pending_payments(), 3)
+        # the one-minute-old payment is still inside the webhook's window
+        self.assertEqual(self.statuses(), [PaymentChoice.COMPLETED] * 3 + [PaymentChoice.PENDING])
+        self.assertEqual(len(self.stub.calls), 3)
+
+    def test_fails_stale_payments_the_gateway_still_reports_pending(self):
+        self.stub.verify_status = 'pending'
+        reconcile_pending_payments()
+        self.assertEqual(self.statuses(), [PaymentChoice.PENDING, PaymentChoice.PENDING, PaymentChoice.FAILED, PaymentChoice.PENDING])
+
+
+
+class ListingCacheTests(APITestCase):
+    def setUp(self):
+        caches['listings'].clear()
+        self.agent = make_user('agent', RoleChoice.AGENT)
+        self.traveler = make_user('traveler')
+        self.listing = make_listing(self.agent)
+        self.other = make_listing(self.agent, title='Other')
+
+    def test_repeat_reads_are_served_from_cache(self):
+        list_url = reverse('listings:listing-view-list')
+        detail_url = reverse('listings:listing-view-detail', args=[self.listing.pk])
+        self.client.get(list_url)
+        self.client.get(detail_url)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(results(self.client.get(list_url))), 2)
+            self.assertEqual(self.client.get(detail_url).data['title'], 'Kigali Hills Cottage')
+
+    def test_changes_invalidate_only_affected_entries(self):
+        detail_url = reverse('listings:listing-view-detail', args=[self.listing.pk])
+        other_url = reverse('listings:listing-view-detail', args=[self.other.pk])
+        self.client.get(detail_url)
+        self.client.get(other_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_booking(self.traveler, self.listing, day(3), day(5))
+        self.assertEqual(self.client.get(detail_url).data['booking_count'], 1)
+        with self.assertNumQueries(0):
+            self.client.get(other_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.get(pk=self.listing.pk).delete()
+        self.assertEqual(self.client.get(detail_url).status_code, 404)
+
+    def test_invalidates_once_the_change_commits(self):
+        detail_url = reverse('listings:listing-view-detail', args=[self.listing.pk])
+        self.client.get(detail_url)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Review.objects.create(reviewer=self.traveler, listing=self.listing, rating=4, comment='Nice')
+            # until commit, the cached entry stays under the old token
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(detail_url).data['review_count'], 0)
+        for callback in callbacks:
+            callback()
+        response = self.client.get(detail_url)
+        self.assertEqual((response.data['review_count'], response.data['rating_avg']), (1, '4.00'))
+
+    def test_agent_changes_reach_expanded_listings(self):
+        detail_url = reverse('listings:listing-view-detail', args=[self.listing.pk])
+        self.assertEqual(self.client.get(detail_url, {'expand': 'agent'}).data['agent']['first_name'], 'Agent')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agent.first_name = 'Amani'
+            self.agent.save()
+        self.assertEqual(self.client.get(detail_url, {'expand': 'agent'}).data['agent']['first_name'], 'Amani')
+
+
+
+class ListingRatingTests(APITestCase):
+    def setUp(self):
+        self.agent = make_user('agent', RoleChoice.AGENT)
+        self.traveler = make_user('traveler')
+        self.listing = make_listing(self.agent)
+        self.other = make_listing(self.agent, title='Other')
+
+    def review(self, listing, rating):
+        return Review.objects.create(reviewer=self.traveler, listing=listing, rating=rating, comment='Nice')
+
+    def aggregates(self, listing):
+        listing = Listing.objects.get(pk=listing.pk)
+        return listing.rating_avg, listing.review_count
+
+    def test_aggregates_follow_review_changes(self):
+        first = self.review(self.listing, 5)
+        self.review(self.listing, 4)
+        self.assertEqual(self.aggregates(self.listing), (Decimal('4.50'), 2))
+
+        first = Review.objects.get(pk=first.pk)
+        first.rating = 2
+        first.save()
+        self.assertEqual(self.aggregates(self.listing), (Decimal('3.00'), 2))
+
+        first.listing = self.other
+        first.save()
+        self.assertEqual(self.aggregates(self.listing), (Decimal('4.00'), 1))
+        self.assertEqual(self.aggregates(self.other), (Decimal('2.00'), 1))
+
+        first.delete()
+        self.assertEqual(self.aggregates(self.other), (Decimal('0.00'), 0))
+
+    def test_list_sorts_and_filters_on_rating(self):
+        self.review(self.listing, 3)
+        self.review(self.other, 5)
+        response = self.client.get(reverse('listings:listing-view-list'), {'ordering': '-rating_avg'})
+        self.assertEqual([item['title'] for item in results(response)], ['Other', 'Kigali Hills Cottage'])
+        response = self.client.get(reverse('listings:listing-view-list'), {'min_rating': '4'})
+        self.assertEqual([item['title'] for item in results(response)], ['Other'])
+
+    def test_rebuild_command_recounts_from_reviews(self):
+        self.review(self.listing, 4)
+        self.review(self.listing, 3)
+        Listing.objects.update(rating_total=0, review_count=0, rating_avg=0)
+        call_command('rebuild_ratings', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.aggregates(self.listing), (Decimal('3.50'), 2))
+        self.assertEqual(self.aggregates(self.other), (Decimal('0.00'), 0))
+
+
+
+class ListingSearchTests(APITestCase):
+    def setUp(self):
+        agent = make_user('agent', RoleChoice.AGENT)
+        make_listing(agent, title='Marrakech Traditional Riad', location='Marrakech, Morocco',
+                     description='Riad in the Medina with a rooftop terrace')
+        make_listing(agent, title='Rooftop Loft', location='Ikeja, Lagos, Nigeria',
+                     description='Stylish loft close to Marrakech-style restaurants')
+        make_listing(agent, title='Kente Homestay', location='Kumasi, Ghana',
+                     description='Stay with local artisans')
+        self.url = reverse('listings:listing-view-list')
+
+    def titles(self, query):
+        return [item['title'] for item in results(self.client.get(self.url, {'q': query}))]
+
+    def test_ranks_title_matches_above_description_matches(self):
+        self.assertEqual(self.titles('marrakech'), ['Marrakech Traditional Riad', 'Rooftop Loft'])
+        self.assertEqual(self.titles('ROOFTOP'), ['Rooftop Loft', 'Marrakech Traditional Riad'])
+
+    def test_requires_every_term_and_ignores_accents(self):
+        self.assertEqual(self.titles('rooftop lagos'), ['Rooftop Loft'])
+        self.assertEqual(self.titles('Kénte'), ['Kente Homestay'])
+        self.assertEqual(self.titles('the'), [])
+
+    def test_index_follows_edits(self):
+        listing = Listing.objects.get(title='Kente Homestay')
+        listing.title = 'Ashanti Weaver Homestay'
+        listing.save()
+        self.assertEqual(self.titles('kente'), [])
+        self.assertEqual(self.titles('ashanti'), ['Ashanti Weaver Homestay'])
+
+    def test_other_listing_reports_take_the_search_param(self):
+        url = reverse('listings:listing-view-available')
+        response = self.client.get(url, {'check_in': '12/01/2026', 'check_out': '16/01/2026', 'q': 'marrakech'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['title'] for item in results(response)], ['Marrakech Traditional Riad', 'Rooftop Loft'])
+
+        # revenue keeps its own ordering and rows
+        response = self.client.get(reverse('listings:listing-view-revenue'), {'q': 'marrakech'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(results(response)), 3)
+
+
+
+class SeedCommandTests(APITestCase):
+    def seed(self, **options):
+        call_command('seed', stdout=StringIO(), batch_size=7, **options)
+
+    def test_seeds_requested_volume_without_overlapping_stays(self):
+        self.seed(listings=25, bookings=120, seed=42)
+        self.assertEqual(Listing.objects.count(), 25)
+        self.assertEqual(Booking.objects.count(), 120)
+        for booking in Booking.objects.all()[:40]:
+            clashes = Booking.objects.filter(listing_id=booking.listing_id).overlapping(
+                booking.check_in, booking.check_out
+            ).exclude(pk=booking.pk)
+            self.assertFalse(clashes.exists())
+        listing = Listing.objects.filter(review_count__gt=0).first()
+        self.assertEqual(listing.review_count, listing.reviews.count())
+
+    def test_same_seed_gives_same_dataset(self):
+        self.seed(listings=5, bookings=20, seed=7)
+        first = list(Booking.objects.order_by('pk').values_list('pk', 'check_in', 'status'))
+        self.seed(listings=5, bookings=20, seed=7)
+        self.assertEqual(list(Booking.objects.order_by('pk').values_list('pk', 'check_in', 'status')), first)
+
+
+
+class BenchmarkSummaryTests(APITestCase):
+    def test_nearest_rank_percentiles(self):
+        timings = list(range(1, 101))
+        self.assertEqual([percentile(timings, pct) for pct in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual(percentile([7.0], 99), 7.0)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summary_counts_queries_and_throughput(self):
+        summary = summarize([2.0, 1.0, 3.0, 4.0], [3, 1, 1, 3], errors=1, wall=0.5)
+        self.assertEqual(summary['p50_ms'], 2.0)
+        self.assertEqual(summary['throughput_rps'], 8.0)
+        self.assertEqual((summary['queries_mean'], summary['queries_max'], summary['errors']), (2.0, 3, 1))
+
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        metrics.reset()
+        # the catalogue cache is invalidated on commit, which a TestCase never reaches
+        caches['listings'].clear()
+        agent = make_user('agent', RoleChoice.AGENT)
+        make_listing(agent)
+        self.url = reverse('listings:listing-view-list')
+
+    def test_sampled_responses_carry_server_timing_and_feed_the_stats(self):
+        response = self.client.get(self.url)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        stats = metrics.snapshot()['listings:listing-view-list']
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreaterEqual(stats['queries_avg'], 1)
+        self.assertEqual(stats['bytes_max'], len(response.content))
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.snapshot(), {})
+
+    @override_settings(REQUEST_METRICS_QUERY_WARNING=0)
+    def test_query_heavy_requests_are_logged(self):
+        with self.assertLogs('listings.middleware', 'WARNING') as logs:
+            self.client.get(self.url)
+        self.assertIn('listings:listing-view-list', logs.output[0])
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.client.get(self.url)
+        url = reverse('request-metrics')
+        self.assertIn(self.client.get(url).status_code, (401, 403))
+        admin = make_user('admin')
+        admin.is_staff = True
+        admin.save()
+        self.client.force_authenticate(admin)
+        self.assertIn('listings:listing-view-list', self.client.get(url).data['views'])
+
+
+
+class BookingOverlapTests(APITestCase):
+    def setUp(self):
+        self.traveler = make_user('traveler')
+        self.listing = make_listing(make_user('agent', RoleChoice.AGENT))
+        self.existing = make_booking(self.traveler, self.listing, day(10), day(14))
+        self.url = reverse('listings:booking-view-list')
+
+    def book(self, check_in, check_out, status=BookingChoice.CONFIRMED, listing=None):
+        return self.client.post(self.url, {
+            'listing': str((listing or self.listing).pk),
+            'traveler': str(self.traveler.pk),
+            'num_of_traveler': 1,
+            'check_in': check_in,
+            'check_out': check_out,
+            'status': status,
+        })
+
+    def test_rejects_overlapping_active_booking(self):
+        response = self.book('12/01/2026', '16/01/2026')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_back_to_back_and_cancelled_stays_are_allowed(self):
+        self.assertEqual(self.book('14/01/2026', '16/01/2026').status_code, 201)
+        self.assertEqual(self.book('11/01/2026', '13/01/2026', BookingChoice.CANCELLED).status_code, 201)
+        other = make_listing(self.listing.agent, title='Other')
+        self.assertEqual(self.book('11/01/2026', '13/01/2026', listing=other).status_code, 201)
+
+    def test_rejects_check_out_before_check_in(self):
+        self.assertEqual(self.book('20/01/2026', '18/01/2026').status_code, 400)
+
+    def test_update_does_not_clash_with_itself(self):
+        url = reverse('listings:booking-view-detail', args=[self.existing.pk])
+        self.assertEqual(self.client.patch(url, {'check_out': '15/01/2026'}).status_code, 200)
+        make_booking(self.traveler, self.listing, day(20), day(22))
+        self.assertEqual(self.client.patch(url, {'check_out': '21/01/2026'}).status_code, 400)
+
+
+
+class BulkCreateTests(APITestCase):
+    def setUp(self):
+        self.agent = make_user('agent', RoleChoice.AGENT)
+        self.traveler = make_user('traveler')
+        self.listing = make_listing(self.agent)
+        make_booking(self.traveler, self.listing, day(10), day(14))
+
+    def listing_item(self, title, **overrides):
+        item = {
+            'agent': str(self.agent.pk),
+            'title': title,
+            'description': 'Imported from a channel manager',
+            'location': 'Zanzibar, Tanzania',
+            'price_per_night': '80.00',
+            'max_guests': 2,
+        }
+        item.update(overrides)
+        return item
+
+    def booking_item(self, check_in, check_out, listing=None, status=BookingChoice.CONFIRMED):
+        return {
+            'listing': str(listing or self.listing.pk),
+            'traveler': str(self.traveler.pk),
+            'num_of_traveler': 1,
+            'check_in': check_in,
+            'check_out': check_out,
+            'status': status,
+        }
+
+    def test_listings_report_errors_per_item_and_stay_searchable(self):
+        list_url = reverse('listings:listing-view-list')
+        self.client.get(list_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('listings:listing-view-bulk'), [
+                self.listing_item('Stone Town Loft'),
+                self.listing_item('Broken', max_guests=0),
+                self.listing_item('Nungwi Beach Hut'),
+            ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([item['index'] for item in response.data['created']], [0, 2])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(len(results(self.client.get(list_url))), 3)
+        titles = [item['title'] for item in results(self.client.get(list_url, {'q': 'nungwi'}))]
+        self.assertEqual(titles, ['Nungwi Beach Hut'])
+
+    @override_settings(BULK_CHUNK_SIZE=2)
+    def test_bookings_reject_overlaps_with_stored_and_batched_stays(self):
+        response = self.client.post(reverse('listings:booking-view-bulk'), {'items': [
+            self.booking_item('01/01/2026', '05/01/2026'),
+            self.booking_item('12/01/2026', '13/01/2026'),
+            self.booking_item('04/01/2026', '06/01/2026'),
+            self.booking_item('04/01/2026', '06/01/2026', status=BookingChoice.CANCELLED),
+            self.booking_item('20/01/2026', '22/01/2026', listing='not-a-uuid'),
+            self.booking_item('14/01/2026', '16/01/2026'),
+        ]}, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([item['index'] for item in response.data['created']], [0, 3, 5])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 4])
+        self.assertEqual(Booking.objects.count(), 4)
+
+    def test_bookings_validate_with_a_constant_number_of_queries(self):
+        items = [self.booking_item(f'{d:02d}/02/2026', f'{d + 1:02d}/02/2026') for d in range(1, 28)]
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse('listings:booking-view-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 27)
+        self.assertLess(len(captured), 10)
+
+    def test_rejects_empty_and_oversized_batches(self):
+        url = reverse('listings:booking-view-bulk')
+        self.assertEqual(self.client.post(url, [], format='json').status_code, 400)
+        with override_settings(BULK_MAX_ITEMS=1):
+            items = [self.booking_item('01/03/2026', '02/03/2026')] * 2
+            self.assertEqual(self.client.post(url, items, format='json').status_code, 400)
+
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.traveler = make_user('traveler')
+        self.listing = make_listing(make_user('agent', RoleChoice.AGENT))
+        for d in range(1, 8, 2):
+            make_booking(self.traveler, self.listing, day(d), day(d + 1))
+        self.url = reverse('listings:booking-view-list')
+
+    def test_fields_trim_the_response_and_the_select(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url, {'fields': 'booking_id,status,nope', 'page_size': 2})
+        self.assertEqual([set(item) for item in results(response)], [{'booking_id', 'status'}] * 2)
+        self.assertEqual(len(captured), 2)
+        self.assertNotIn('num_of_traveler', captured[-1]['sql'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(results(response)), 2)
+
+    def test_expand_nests_relations_with_a_join(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url, {'expand': 'listing,traveler', 'fields': 'booking_id'})
+        items = results(response)
+        self.assertEqual(len(items), 4)
+        self.assertEqual(items[0]['listing']['title'], self.listing.title)
+        self.assertEqual(items[0]['traveler']['username'], 'traveler')
+        self.assertEqual(len(captured), 1)
+
+    def test_listing_fields_keep_expanded_bookings(self):
+        url = reverse('listings:listing-view-detail', args=[self.listing.pk])
+        response = self.client.get(url, {'fields': 'title', 'expand': 'bookings'})
+        self.assertEqual(set(response.data), {'title', 'recent_bookings'})
+        self.assertEqual(len(response.data['recent_bookings']), 4)
+
+    def test_writes_ignore_fields(self):
+        url = reverse('listings:review-view-list') + '?fields=rating'
+        response = self.client.post(url, {
+            'listing': str(self.listing.pk), 'reviewer': str(self.traveler.pk), 'rating': 4, 'comment': 'Lovely',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('comment', response.data)
+
+
+
+class QueryPlanTests(APITestCase):
+    """The hot lookups must be answered from their composite indexes, not table scans."""
+
+    def setUp(self):
+        self.traveler = make_user('traveler')
+        self.listing = make_listing(make_user('agent', RoleChoice.AGENT))
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'{index_name} not used:\n{plan}')
+
+    def test_hot_queries_use_composite_indexes(self):
+        self.assertUsesIndex(
+            Booking.objects.filter(listing=self.listing).overlapping(day(1), day(5)),
+            'booking_availability_idx',
+        )
+        self.assertUsesIndex(
+            Booking.objects.filter(traveler=self.traveler).order_by('-created_at')[:20],
+            'booking_traveler_recent_idx',
+        )
+        self.assertUsesIndex(
+            Payment.objects.filter(status=PaymentChoice.PENDING, created_at__lte=day(1)),
+            'payment_status_created_idx',
+        )
+        self.assertUsesIndex(
+            Review.objects.filter(listing=self.listing).order_by('-created_at')[:20],
+            'review_listing_recent_idx',
+        )
+        self.assertUsesIndex(
+            Listing.objects.filter(location='Kigali, Rwanda', price_per_night__lte=100),
+            'listing_location_price_idx',
+        )
+
+
+
+class FastListTests(APITestCase):
+    def setUp(self):
+        traveler = make_user('traveler')
+        listing = make_listing(make_user('agent', RoleChoice.AGENT), price_per_night=Decimal('72.50'))
+        for d in range(1, 20, 3):
+            booking = make_booking(traveler, listing, day(d), day(d + 2), status=BookingChoice.PENDING)
+            Payment.objects.create(booking=booking, amount=Decimal('145.00'), gateway='Chapa', txn_ref=f'ref-{d}')
+
+    def assertSameAsRegularPath(self, view, url, params):
+        fast = self.client.get(url, params)
+        with mock.patch.object(view, 'fast_list', False):
+            regular = self.client.get(url, params)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, regular.content)
+        return fast
+
+    def test_booking_lists_are_byte_identical(self):
+        url = reverse('listings:booking-view-list')
+        response = self.assertSameAsRegularPath(BookingViewSet, url, {'page_size': 4})
+        self.assertSameAsRegularPath(BookingViewSet, response.data['next'], {})
+        self.assertSameAsRegularPath(BookingViewSet, url, {'fields': 'booking_id,total_price', 'min_total_price': 100})
+        self.assertSameAsRegularPath(BookingViewSet, url, {'expand': 'listing'})
+
+    def test_payment_list_is_byte_identical(self):
+        self.assertSameAsRegularPath(PaymentListAPIView, reverse('payment-list'), {'page_size': 5})
+
+    def test_list_reads_rows_not_instances(self):
+        with mock.patch.object(Booking, 'from_db', side_effect=AssertionError('model instance built')):
+            response = self.client.get(reverse('listings:booking-view-list'))
+        self.assertEqual(len(results(response)), 7)
+
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        # the catalogue cache is invalidated on commit, which a TestCase never reaches
+        caches['listings'].clear()
+        self.traveler = make_user('traveler')
+        self.listing = make_listing(make_user('agent', RoleChoice.AGENT))
+        self.booking = make_booking(self.traveler, self.listing, day(1), day(3))
+
+    def test_listing_detail_revalidates_without_queries(self):
+        url = reverse('listings:listing-view-detail', args=[self.listing.pk])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_booking(self.traveler, self.listing, day(5), day(6))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['booking_count'], 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_booking_list_etag_follows_rows_and_listing_price(self):
+        url = reverse('listings:booking-view-list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.listing.price_per_night = Decimal('99.00')
+        self.listing.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_booking_detail_honours_if_modified_since(self):
+        url = reverse('listings:booking-view-detail', args=[self.booking.pk])
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        missing = reverse('listings:booking-view-detail', args=['not-a-uuid'])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+
+@override_settings(EXPORT_CHUNK_SIZE=3)
+class ExportTests(APITestCase):
+    def setUp(self):
+        traveler = make_user('traveler')
+        listing = make_listing(make_user('agent', RoleChoice.AGENT))
+        for d in range(1, 20, 3):
+            booking = make_booking(traveler, listing, day(d), day(d + 2))
+            Payment.objects.create(booking=booking, amount=Decimal('130.00'), gateway='Chapa', txn_ref=f'ref-{d}')
+        self.url = reverse('listings:booking-view-export')
+
+    def export(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_streams_every_row_in_list_order(self):
+        listed = json.loads(self.client.get(reverse('listings:booking-view-list'), {'page_size': 100}).content)
+        with self.assertNumQueries(3):
+            body = self.export(self.url, {'output': 'ndjson'})
+        self.assertEqual([json.loads(line) for line in body.splitlines()], listed['results'])
+
+    def test_csv_applies_list_filters_and_expansions(self):
+        rows = list(csv.DictReader(StringIO(self.export(self.url, {}))))
+        self.assertEqual([row['check_in'] for row in rows], [f'{d:02}/01/2026' for d in range(19, 0, -3)])
+        # header only
+        self.assertEqual(len(self.export(self.url, {'min_total_price': 131}).splitlines()), 1)
+
+        rows = list(csv.DictReader(StringIO(self.export(self.url, {'fields': 'booking_id,listing', 'expand': 'listing'}))))
+        self.assertEqual(list(rows[0]), ['booking_id', 'listing'])
+        self.assertEqual(json.loads(rows[0]['listing'])['title'], 'Kigali Hills Cottage')
+        self.assertEqual(len({row['booking_id'] for row in rows}), 7)
+
+    def test_expanded_exports_join_instead_of_querying_per_row(self):
+        # one query per chunk of three, however the rows are expanded
+        with self.assertNumQueries(3):
+            rows = list(csv.DictReader(StringIO(self.export(self.url, {'expand': 'listing'}))))
+        self.assertEqual(json.loads(rows[0]['listing'])['title'], 'Kigali Hills Cottage')
+        with self.assertNumQueries(3):
+            lines = self.export(self.url, {'expand': 'traveler', 'fields': 'booking_id,traveler', 'output': 'ndjson'}).splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(json.loads(lines[0])['traveler']['username'], 'traveler')
+
+    def test_payment_export(self):
+        response = self.client.get(reverse('payment-export'))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="payment.csv"')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(sorted(row['txn_ref'] for row in rows), sorted(f'ref-{d}' for d in range(1, 20, 3)))
+
+    def test_unknown_output_is_rejected(self):
+        response = self.client.get(self.url, {'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    dlat, dlng = math.radians(lat2 - lat1), math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 2 * geo.EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+
+class ProximitySearchTests(APITestCase):
+    KIGALI = (-1.9441, 30.0619)
+
+    def setUp(self):
+        self.agent = make_user('agent', RoleChoice.AGENT)
+        self.cottage = make_listing(self.agent, title='Cottage', latitude=-1.9500, longitude=30.0600)
+        self.loft = make_listing(self.agent, title='Loft', latitude=-1.9300, longitude=30.1000)
+        self.kampala = make_listing(self.agent, title='Kampala', latitude=0.3476, longitude=32.5825)
+        self.nairobi = make_listing(self.agent, title='Nairobi', latitude=-1.2921, longitude=36.8219)
+        make_listing(self.agent, title='Nowhere')
+        self.url = reverse('listings:listing-view-list')
+
+    def near(self, **params):
+        response = self.client.get(self.url, {'near': '%s,%s' % self.KIGALI, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return results(response)
+
+    def test_radius_and_k_nearest(self):
+        rows = self.near(radius=50)
+        self.assertEqual([row['title'] for row in rows], ['Cottage', 'Loft'])
+        self.assertAlmostEqual(rows[1]['distance'], haversine_km(*self.KIGALI, -1.93, 30.1), places=6)
+        self.assertEqual([row['title'] for row in self.near(k=3)], ['Cottage', 'Loft', 'Kampala'])
+        self.assertEqual(len(self.near(k=50)), 4)
+
+    def test_k_nearest_beyond_the_coarsest_block(self):
+        make_listing(self.agent, title='Vancouver', latitude=49.2827, longitude=-123.1207)
+        make_listing(self.agent, title='Santiago', latitude=-33.4489, longitude=-70.6693)
+        nearest = geo.nearest(Listing.objects.all(), *self.KIGALI, 5).order_by('distance')
+        self.assertEqual(
+            [listing.title for listing in nearest], ['Cottage', 'Loft', 'Kampala', 'Nairobi', 'Santiago'],
+        )
+
+    def test_list_searches_once_for_validators_and_page(self):
+        caches['listings'].clear()
+        with mock.patch('listings.geo.nearest', wraps=geo.nearest) as nearest:
+            self.near(k=3)
+        self.assertEqual(nearest.call_count, 1)
+
+    def test_other_listing_reports_take_the_near_param(self):
+        near = '%s,%s' % self.KIGALI
+        response = self.client.get(
+            reverse('listings:listing-view-available'),
+            {'check_in': '12/01/2026', 'check_out': '16/01/2026', 'near': near, 'radius': 50},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['title'] for item in results(response)], ['Cottage', 'Loft'])
+
+        # revenue keeps its own ordering and rows
+        response = self.client.get(reverse('listings:listing-view-revenue'), {'near': near})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(results(response)), 5)
+
+    def test_geohash_follows_coordinates(self):
+        self.assertEqual(self.cottage.geohash, geo.encode(-1.95, 30.06))
+        self.cottage.latitude, self.cottage.longitude = None, None
+        self.cottage.save(update_fields=['latitude', 'longitude'])
+        self.cottage.refresh_from_db()
+        self.assertEqual(self.cottage.geohash, '')
+        self.assertEqual(Listing.objects.get(pk=self.loft.pk).geohash[:5], geo.encode(-1.93, 30.1, 5))
+
+    def test_matches_brute_force_everywhere(self):
+        rng = random.Random(3)
+        points = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(150)]
+        # a cluster straddling the antimeridian
+        points += [(rng.uniform(-1, 1), rng.choice([-1, 1]) * rng.uniform(179.5, 180)) for _ in range(30)]
+        Listing.objects.bulk_create([
+            Listing(agent=self.agent, title=f'P{n}', description='x', location='x', price_per_night=1,
+                    max_guests=1, latitude=lat, longitude=lng)
+            for n, (lat, lng) in enumerate(points)
+        ])
+        located = list(Listing.objects.exclude(geohash='').values_list('pk', 'latitude', 'longitude'))
+        for lat, lng, radius in [(0.0, 179.9, 80), (0.3, -179.8, 30), (45.0, 10.0, 1500), (-60.0, 100.0, 4000)]:
+            expected = {pk for pk, a, b in located if haversine_km(lat, lng, a, b) <= radius}
+            found = set(geo.within(Listing.objects.all(), lat, lng, radius).values_list('pk', flat=True))
+            self.assertEqual(found, expected, (lat, lng, radius))
+
+            ranked = sorted(located, key=lambda row: haversine_km(lat, lng, row[1], row[2]))
+            nearest = geo.nearest(Listing.objects.all(), lat, lng, 5).order_by('distance')
+            self.assertEqual(list(nearest.values_list('pk', flat=True)[:5]), [row[0] for row in ranked[:5]])
+
+    def test_cell_scan_uses_geohash_index(self):
+        queryset = geo.within(Listing.objects.all(), *self.KIGALI, 10)
+        self.assertIn('listing_geohash_idx', queryset.explain())
+
+    def test_rejects_bad_input(self):
+        self.assertEqual(self.client.get(self.url, {'near': 'kigali'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'near': '95,30'}).status_code, 400)
+        response = self.client.patch(
+            reverse('listings:listing-view-detail', args=[self.loft.pk]), {'latitude': None}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+
+# Friday and Saturday nights cost a quarter more, the new year fortnight 40% more
+PRICING_RULES = [
+    {'kind': 'weekday', 'weekdays': [4, 5], 'adjustment': '0.25'},
+    {'kind': 'season', 'start': '2025-12-24', 'end': '2026-01-07', 'adjustment': '0.40'},
+]
+
+
+def nightly_total(price, check_in, check_out):
+    """PRICING_RULES applied one night at a time."""
+    total = Decimal('0')
+    for n in range(max((check_out - check_in).days, 1)):
+        night = check_in + timedelta(days=n)
+        rate = Decimal('1')
+        if night.weekday() in (4, 5):
+            rate += Decimal('0.25')
+        if datetime(2025, 12, 24).date() <= night < datetime(2026, 1, 7).date():
+            rate += Decimal('0.40')
+        total += price * rate
+    return total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+
+@override_settings(PRICING_RULES=PRICING_RULES)
+class QuoteTests(APITestCase):
+    def setUp(self):
+        self.agent = make_user('agent', RoleChoice.AGENT)
+        self.traveler = make_user('traveler')
+        self.cheap = make_listing(self.agent, title='Cheap', price_per_night=Decimal('40.00'))
+        self.dear = make_listing(self.agent, title='Dear', price_per_night=Decimal('133.33'))
+        self.url = reverse('listings:listing-view-quote')
+
+    def test_bookings_and_quotes_share_the_rules(self):
+        rng = random.Random(5)
+        start = timezone.make_aware(datetime(2025, 12, 1))
+        stays = []
+        for n in range(40):
+            check_in = start + timedelta(days=rng.randint(0, 60), hours=rng.randint(0, 23))
+            check_out = check_in + timedelta(days=rng.randint(0, 12), hours=rng.randint(1, 23))
+            stays.append((check_in, check_out))
+            make_booking(self.traveler, rng.choice([self.cheap, self.dear]), check_in, check_out, status=BookingChoice.CANCELLED)
+
+        quoted = pricing.quote(Listing.objects.all(), [(a.date(), b.date()) for a, b in stays])
+        for booking in Booking.objects.with_total_price().select_related('listing'):
+            expected = nightly_total(booking.listing.price_per_night, booking.check_in.date(), booking.check_out.date())
+            self.assertEqual(booking.total_price, expected)
+            self.assertEqual(Booking.objects.get(pk=booking.pk).total_price, expected)
+            position = stays.index((booking.check_in, booking.check_out))
+            self.assertEqual(quoted[booking.listing_id][position], expected)
+
+    def test_revenue_follows_the_rules(self):
+        make_booking(self.traveler, self.dear, day(2), day(5))
+        make_booking(self.traveler, self.dear, day(9), day(12))
+        listing = Listing.objects.with_revenue().get(pk=self.dear.pk)
+        expected = nightly_total(self.dear.price_per_night, day(2).date(), day(5).date())
+        expected += nightly_total(self.dear.price_per_night, day(9).date(), day(12).date())
+        self.assertEqual(listing.revenue, expected)
+
+    def test_quotes_many_listings_and_stays_in_one_query(self):
+        missing = '00000000-0000-0000-0000-000000000000'
+        payload = {
+            'listings': [str(self.dear.pk), missing, str(self.cheap.pk), str(self.dear.pk)],
+            'stays': [
+                {'check_in': '02/01/2026', 'check_out': '05/01/2026'},
+                {'check_in': '12/01/2026', 'check_out': '13/01/2026'},
+            ],
+        }
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([stay['nights'] for stay in response.data['stays']], [3, 1])
+        self.assertEqual(response.data['stays'][0]['check_in'], '02/01/2026')
+        # Fri 2nd and Sat 3rd in season, Sun 4th in season; Mon 12th plain
+        self.assertEqual(response.data['quotes'], [
+            {'listing': self.dear.pk, 'total_prices': ['626.65', '133.33']},
+            {'listing': self.cheap.pk, 'total_prices': ['188.00', '40.00']},
+        ])
+
+    def test_rejects_bad_input(self):
+        stay = {'check_in': '02/01/2026', 'check_out': '05/01/2026'}
+        response = self.client.post(self.url, {'listings': [], 'stays': [stay]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            self.url, {'listings': [str(self.cheap.pk)], 'stays': [{'check_in': '05/01/2026', 'check_out': '05/01/2026'}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        with self.settings(QUOTE_MAX_STAYS=1):
+            response = self.client.post(self.url, {'listings': [str(self.cheap.pk)], 'stays': [stay, stay]}, format='json')
+        self.assertEqual(response.status_code, 400)
@@ -3,6 +3,8 @@ from django.urls import path, include
 from rest_framework import routers
 from listings.views import UserViewSet, ListingViewSet, BookingViewSet, ReviewViewSet
 from listings.views import PaymentListAPIView, ChapaInitiatePaymentAPIView, ChapaPaymentVerifyAPIView
+from listings.views import ChapaWebhookAPIView, PaymentExportAPIView, RequestMetricsAPIView
+from listings.views import AsyncChapaInitiatePaymentView, AsyncChapaPaymentVerifyView
 
 
 
@@ -18,8 +20,13 @@ router.register(r'reviews', ReviewViewSet, basename='review-view')
 urlpatterns = [
     path('', include((router.urls, 'listings'))),
     path('payments/', PaymentListAPIView.as_view(), name='payment-list'),
+    path('payments/export/', PaymentExportAPIView.as_view(), name='payment-export'),
     path('payment/chapa/', ChapaInitiatePaymentAPIView.as_view(), name='chapa-initiate'),
     path('payment/chapa/verify/', ChapaPaymentVerifyAPIView.as_view(), name='chapa-verify'),
+    path('payment/chapa/async/', AsyncChapaInitiatePaymentView.as_view(), name='chapa-initiate-async'),
+    path('payment/chapa/verify/async/', AsyncChapaPaymentVerifyView.as_view(), name='chapa-verify-async'),
+    path('payment/chapa/webhook/', ChapaWebhookAPIView.as_view(), name='chapa-webhook'),
+    path('metrics/', RequestMetricsAPIView.as_view(), name='request-metrics'),
 
 ]
 
@@ -1,146 +1,648 @@
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.shortcuts import render
+from django.core.cache import cache
+from django.urls import reverse
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Prefetch, Q
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 from rest_framework import generics
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework import status
-from .models import User, Listing, Booking, Review, Payment, BookingChoice, PaymentChoice
+from .models import User, Listing, Booking, Review, Payment, BookingChoice, PaymentChoice, ACTIVE_BOOKING_STATUSES
 from .serializers import UserSerializer, ListingSerializer, BookingSerializer, ReviewSerializer, PaymentSerializer
+from .serializers import ListingAvailabilitySerializer, ListingFilterSerializer, BookingFilterSerializer
+from .serializers import ListingQuoteSerializer, StaySerializer
+from .serializers import requested_expansions, requested_fields, BOOKING_OVERLAP_ERROR
+from .bulk import BulkCreateMixin, StayCalendar
+from .export import ExportMixin
+from .fast import FastListMixin
+from .filters import ListingProximityFilter, ListingSearchFilter
+from .pagination import UserCursorPagination, RevenueCursorPagination
+from . import pricing
+from . import cache as listing_cache
+from .search import index_listings
+from .gateways import GatewayError, PaymentDeclined, get_gateway
+from .middleware import metrics
 from decimal import Decimal
-import requests
+import hashlib
+import json
 import uuid
 
 
+RECENT_BOOKINGS_LIMIT = 5
 
 
-class UserViewSet(viewsets.ModelViewSet):
+
+class SparseFieldsMixin:
+    """
+    Matches the query to a serializer trimmed by ``?fields=``/``?expand=``:
+    only the columns the serializer and the pagination ordering read are
+    loaded, and expanded foreign keys are joined instead of fetched per row.
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields = requested_fields(self.request)
+        if self.action not in ('list', 'retrieve', 'export') or (fields is None and not requested_expansions(self.request)):
+            return queryset
+
+        opts = queryset.model._meta
+        concrete = {field.name: field for field in opts.concrete_fields}
+        columns = {opts.pk.name}
+        related = []
+        for field in self.get_serializer().fields.values():
+            if field.source in concrete:
+                columns.add(field.source)
+                if isinstance(field, BaseSerializer) and concrete[field.source].is_relation:
+                    related.append(field.source)
+        if related:
+            queryset = queryset.select_related(*related)
+        if fields is None:
+            return queryset
+
+        # deferring a column the paginator reads would cost a query per row
+        for name in self.ordering_columns(queryset):
+            if name in concrete:
+                columns.add(name)
+        return queryset.only(*columns)
+
+    def ordering_columns(self, queryset):
+        ordering = list(queryset.query.order_by) + list(queryset.model._meta.ordering)
+        # exports walk the paginator's ordering too (see export.py)
+        if self.action in ('list', 'export') and hasattr(self.paginator, 'get_ordering'):
+            ordering += self.paginator.get_ordering(self.request, queryset, self)
+        pk_name = queryset.model._meta.pk.name
+        return {pk_name if name == 'pk' else name for name in (str(item).lstrip('-') for item in ordering)}
+
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETag and Last-Modified for list and retrieve, derived from the
+    ``timestamp_fields`` maxima and a row count instead of the body, so a
+    matching If-None-Match/If-Modified-Since gets a 304 before anything is
+    serialized. Expansions whose data those timestamps do not cover
+    switch it off.
+    """
+    timestamp_fields = ('updated_at',)
+    conditional_expansions = set()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    def conditional(self, view, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return view(request, *args, **kwargs)
+
+        last_modified, token = validators
+        # the body also depends on the renderer, the query string and the host in its links
+        raw = f'{token}|{request.accepted_media_type}|{request.build_absolute_uri()}'
+        etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def filter_queryset(self, queryset):
+        # list() filters again after the validators; backends that query to filter (?near=) run once
+        if self.action != 'list':
+            return super().filter_queryset(queryset)
+        if getattr(self, '_filtered_list', None) is None:
+            self._filtered_list = super().filter_queryset(queryset)
+        return self._filtered_list
+
+    def get_validators(self):
+        """``(last_modified, token)`` for the current request, or None to skip conditional handling."""
+        if requested_expansions(self.request) - self.conditional_expansions:
+            return None
+        if self.action == 'list':
+            queryset = self.filter_queryset(self.get_queryset()).order_by()
+            aggregates = {field: Max(field) for field in self.timestamp_fields}
+            row = queryset.aggregate(row_count=Count('pk'), **aggregates)
+            stamps = [row[field] for field in self.timestamp_fields]
+            token = [row['row_count'], *stamps]
+        else:
+            try:
+                stamps = (
+                    self.queryset.model._default_manager.filter(pk=self.kwargs['pk'])
+                    .values_list(*self.timestamp_fields).first()
+                )
+            except (ValueError, DjangoValidationError):
+                stamps = None
+            if stamps is None:
+                return None
+            token = list(stamps)
+        present = [stamp for stamp in stamps if stamp is not None]
+        return (max(present) if present else None), '|'.join(str(value) for value in token)
+
+
+
+class UserViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = UserCursorPagination
+
+
+class ListingCacheMixin:
+    """Serves list and retrieve from the listings response cache (see cache.py)."""
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(listing_cache.list_key(request), super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        key = listing_cache.detail_key(kwargs['pk'], request)
+        return self.cached(key, super().retrieve, request, *args, **kwargs)
+
+    def cached(self, key, view, *args, **kwargs):
+        data = listing_cache.get_cache().get(key)
+        if data is not None:
+            return Response(data)
+        response = view(*args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            listing_cache.get_cache().set(key, response.data)
+        return response
+
 
 
-class ListingViewSet(viewsets.ModelViewSet):
+class ListingViewSet(ConditionalGetMixin, ListingCacheMixin, SparseFieldsMixin, BulkCreateMixin, viewsets.ModelViewSet):
     queryset = Listing.objects.all()
     serializer_class = ListingSerializer
+    # the first backend with an ordering wins: distance, then search rank, then ?ordering=
+    filter_backends = [ListingProximityFilter, ListingSearchFilter, OrderingFilter]
+    ordering_fields = ['created_at', 'price_per_night', 'rating_avg', 'review_count']
+    # booking changes touch the listing (signals.py), so recent bookings are covered
+    conditional_expansions = {'bookings'}
 
+    def get_queryset(self):
+        queryset = super().get_queryset().with_booking_count()
+        if self.action == 'list':
+            params = ListingFilterSerializer(data=self.request.query_params)
+            params.is_valid(raise_exception=True)
+            if 'min_rating' in params.validated_data:
+                queryset = queryset.filter(rating_avg__gte=params.validated_data['min_rating'])
+        if 'bookings' in requested_expansions(self.request):
+            recent = Booking.objects.order_by('-created_at')[:RECENT_BOOKINGS_LIMIT]
+            queryset = queryset.prefetch_related(Prefetch('bookings', queryset=recent, to_attr='recent_bookings'))
+        return queryset
 
-class BookingViewSet(viewsets.ModelViewSet):
+    def get_validators(self):
+        # memoised under the catalogue cache tokens, so cache hits stay free of queries
+        if self.action == 'list':
+            key = listing_cache.list_key(self.request)
+        else:
+            key = listing_cache.detail_key(self.kwargs['pk'], self.request)
+        key += ':validators'
+        validators = listing_cache.get_cache().get(key)
+        if validators is None:
+            validators = super().get_validators()
+            if validators is not None:
+                listing_cache.get_cache().set(key, validators)
+        return validators
+
+    def bulk_created(self, listings):
+        index_listings(listings)
+        listing_cache.invalidate_on_commit([])
+
+    @action(detail=False, methods=['get'])
+    def available(self, request):
+        params = ListingAvailabilitySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        search = params.validated_data
+
+        queryset = self.get_queryset().available(search['check_in'], search['check_out'])
+        if 'location' in search:
+            queryset = queryset.filter(location__icontains=search['location'])
+        if 'guests' in search:
+            queryset = queryset.filter(max_guests__gte=search['guests'])
+        if 'min_price' in search:
+            queryset = queryset.filter(price_per_night__gte=search['min_price'])
+        if 'max_price' in search:
+            queryset = queryset.filter(price_per_night__lte=search['max_price'])
+        # the paginator orders by the backends' rank (?q=, ?near=), so they must annotate it
+        queryset = self.filter_queryset(queryset)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def quote(self, request):
+        """Totals for every listing and stay asked for, priced as bookings are (see pricing.py)."""
+        params = ListingQuoteSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        listing_ids = params.validated_data['listings']
+        stays = params.validated_data['stays']
+
+        dates = [(stay['check_in'], stay['check_out']) for stay in stays]
+        totals = pricing.quote(Listing.objects.filter(pk__in=listing_ids), dates)
+        tariff = pricing.get_tariff()
+        return Response({
+            'stays': [
+                {**StaySerializer(stay).data, 'nights': tariff.stay_nights(*stay_dates)[0]}
+                for stay, stay_dates in zip(stays, dates)
+            ],
+            # listings that do not exist are left out
+            'quotes': [
+                {'listing': listing_id, 'total_prices': [str(total) for total in totals[listing_id]]}
+                for listing_id in listing_ids if listing_id in totals
+            ],
+        })
+
+    # no filter backends: the report is ordered by revenue alone
+    @action(detail=False, methods=['get'], pagination_class=RevenueCursorPagination, filter_backends=[])
+    def revenue(self, request):
+        queryset = (
+            Listing.objects.with_revenue()
+            .annotate(confirmed_bookings=Count('bookings', filter=Q(bookings__status=BookingChoice.CONFIRMED)))
+            .values('listing_id', 'title', 'confirmed_bookings', 'revenue')
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.revenue_rows(page))
+        return Response(self.revenue_rows(queryset))
+
+    def revenue_rows(self, rows):
+        # SQLite hands computed decimals back without a fixed exponent
+        return [{**row, 'revenue': row['revenue'].quantize(pricing.CENTS)} for row in rows]
+
+
+class BookingViewSet(ConditionalGetMixin, FastListMixin, SparseFieldsMixin, BulkCreateMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
+    # total_price follows the listing's nightly price
+    timestamp_fields = ('updated_at', 'listing__updated_at')
+    conditional_expansions = {'listing'}
 
+    def get_queryset(self):
+        # annotated per request, so the total follows the current PRICING_RULES
+        queryset = super().get_queryset().with_total_price()
+        if self.action not in ('list', 'export'):
+            return queryset
+        params = BookingFilterSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        if 'min_total_price' in params.validated_data:
+            queryset = queryset.filter(total_price__gte=params.validated_data['min_total_price'])
+        if 'max_total_price' in params.validated_data:
+            queryset = queryset.filter(total_price__lte=params.validated_data['max_total_price'])
+        return queryset
 
-class ReviewViewSet(viewsets.ModelViewSet):
+    def bulk_check(self, chunk):
+        # the same rule as BookingSerializer.reserve, checked for the whole chunk at once
+        active = [data for _, data in chunk if data.get('status') in ACTIVE_BOOKING_STATUSES]
+        if active:
+            listing_ids = {data['listing'].pk for data in active}
+            Listing.objects.lock(listing_ids)
+            stays = Booking.objects.active().filter(
+                listing__in=listing_ids,
+                check_in__lt=max(data['check_out'] for data in active),
+                check_out__gt=min(data['check_in'] for data in active),
+            ).values_list('listing_id', 'check_in', 'check_out')
+            calendar = StayCalendar(stays)
+
+        for index, data in chunk:
+            if data.get('status') in ACTIVE_BOOKING_STATUSES and not calendar.reserve(
+                data['listing'].pk, data['check_in'], data['check_out']
+            ):
+                yield index, data, {'detail': BOOKING_OVERLAP_ERROR}
+            else:
+                yield index, data, None
+
+    def bulk_created(self, bookings):
+        listing_ids = {booking.listing_id for booking in bookings}
+        Listing.objects.touch(listing_ids)
+        listing_cache.invalidate_on_commit(listing_ids)
+
+
+class ReviewViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
 
 
-class PaymentListAPIView(generics.ListAPIView):
+class PaymentListAPIView(FastListMixin, generics.ListAPIView):
+    queryset = Payment.objects.all()
+    serializer_class = PaymentSerializer
+
+
+class PaymentExportAPIView(ExportMixin, generics.GenericAPIView):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
 
+    def get(self, request):
+        return self.export(request)
+
+
+class RequestMetricsAPIView(APIView):
+    """
+    Per-view query and latency aggregates collected by RequestMetricsMiddleware
+    in this process, and the payment gateway's call latency.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        gateway = get_gateway()
+        return Response({
+            'sample_rate': settings.REQUEST_METRICS_SAMPLE_RATE,
+            'views': metrics.snapshot(),
+            'gateway': {'name': gateway.name, 'operations': gateway.latency_stats()},
+        })
+
+    def delete(self, request):
+        metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def store_payment(**fields):
+    """
+    Create a payment, or return None when another request already stored
+    one under the same Idempotency-Key (the per-booking lock can expire).
+    """
+    try:
+        with transaction.atomic():
+            return Payment.objects.create(**fields)
+    except IntegrityError:
+        if fields.get('idempotency_key') is None:
+            raise
+        return None
+
 
 class ChapaInitiatePaymentAPIView(APIView):
     def post(self, request):
         try:
             booking_id = request.data.get('booking_id')
-            booking = Booking.objects.get(booking_id=booking_id)
-        except Booking.DoesNotExist:
+            booking = Booking.objects.with_total_price().select_related('traveler').get(booking_id=booking_id)
+        except (Booking.DoesNotExist, DjangoValidationError):
             return Response(
                 {'detail': 'Booking not found'},
-                status=status.HTTP_400_NOT_FOUND
+                status=status.HTTP_404_NOT_FOUND
                 )
 
+        idempotency_key = request.headers.get('Idempotency-Key') or None
+        if idempotency_key:
+            previous = Payment.objects.filter(idempotency_key=idempotency_key).first()
+            if previous is not None:
+                return self.replay(previous, booking)
+
         if booking.status == BookingChoice.CONFIRMED:
             return Response(
                 {'detail': 'This booking has already been paid and confirmed.'},
                 status=status.HTTP_400_BAD_REQUEST
                 )
 
-        url = 'https://api.chapa.co/v1/transaction/initialize'
+        # one gateway call per booking at a time; concurrent retries back off
+        lock = f'chapa-initiate:{booking.pk}'
+        if not cache.add(lock, idempotency_key or True, timeout=settings.PAYMENT_INITIATE_LOCK_TIMEOUT):
+            return Response(
+                {'detail': 'A payment for this booking is already being initiated.'},
+                status=status.HTTP_409_CONFLICT
+                )
+        try:
+            if idempotency_key:
+                # the request that held the lock before us may have stored a payment under this key
+                previous = Payment.objects.filter(idempotency_key=idempotency_key).first()
+                if previous is not None:
+                    return self.replay(previous, booking)
+            return self.initiate(request, booking, idempotency_key)
+        finally:
+            cache.delete(lock)
+
+    def initiate(self, request, booking, idempotency_key):
         txn_ref = str(uuid.uuid4())
-        first_name = booking.traveler.first_name
-        last_name = booking.traveler.last_name
-        email = booking.traveler.email
-        phone = booking.traveler.phone
-        amount = str(booking.total_price)
-
-        payload = {
-            "amount": amount,
-            "currency": "ETB",
-            "email": email,
-            "first_name": first_name,
-            "last_name": last_name,
-            "phone_number": phone,
-            "tx_ref": txn_ref,
-            "callback_url": "https://webhook.site/077164d6-29cb-40df-ba29-8a00e59a7e60",
-            "return_url": "http://127.0.0.1:8000/api/bookings/",
-            "customization": {
-            "title": "ALX Travel App",
-            "description": "Payment for bookings"
-        }
-        }
-
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {settings.CHAPA_SECRET_KEY}'
-        }
-
-        response = requests.post(url, json=payload, headers=headers)
-        response_data = response.json()
-
-        if response.status_code != 200 or response_data.get('status') != 'success':
-            return Response({'detail': 'Payment Failed', 'error_response': response_data}, status=status.HTTP_400_BAD_REQUEST)
-
-        checkout_url = response_data['data']['checkout_url']
-
-        payment = Payment.objects.create(
+        callback_url = settings.CHAPA_CALLBACK_URL or request.build_absolute_uri(reverse('chapa-webhook'))
+        gateway = get_gateway()
+
+        try:
+            checkout_url = gateway.initialize(booking, txn_ref, callback_url)
+        except GatewayError:
+            return Response({'detail': 'Payment gateway unavailable'}, status=status.HTTP_502_BAD_GATEWAY)
+        except PaymentDeclined as exc:
+            return Response({'detail': 'Payment Failed', 'error_response': exc.response}, status=status.HTTP_400_BAD_REQUEST)
+
+        payment = store_payment(
             booking=booking,
-            amount=Decimal(amount),
-            gateway='Chapa',
+            amount=booking.total_price.quantize(Decimal('0.01')),
+            gateway=gateway.name,
             paid=False,
             status=PaymentChoice.PENDING,
-            txn_ref=txn_ref
+            txn_ref=txn_ref,
+            idempotency_key=idempotency_key,
+            checkout_url=checkout_url
         )
-        payment_info = PaymentSerializer(payment).data
-        print(payment_info)
+        if payment is None:
+            return self.replay(Payment.objects.get(idempotency_key=idempotency_key), booking)
+        return self.initiated(payment)
 
+    def initiated(self, payment):
         return Response({
             'detail': 'Payment Initiated',
-            'checkout_url': checkout_url,
-            'payment': payment_info
+            'checkout_url': payment.checkout_url,
+            'payment': PaymentSerializer(payment).data
         })
 
+    def replay(self, previous, booking):
+        if previous.booking_id != booking.pk:
+            return Response(
+                {'detail': 'This Idempotency-Key was already used for another booking.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+        response = self.initiated(previous)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
 
 
 class ChapaPaymentVerifyAPIView(APIView):
     def post(self, request):
         try:
             txn_ref = request.data.get('txn_ref')
-            print(txn_ref)
             payment = Payment.objects.get(txn_ref=txn_ref)
         except Payment.DoesNotExist:
             return Response({'detail': 'Payment not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        url = f'https://api.chapa.co/v1/transaction/verify/{txn_ref}'
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {settings.CHAPA_SECRET_KEY}'
-        }
-
-        response = requests.get(url, headers=headers)
-        response_data = response.json()
-
-        if response.status_code == 200 and response_data.get('status') == 'success':
-            txn_status = response_data['data']['status']
-            if txn_status == 'success':
-                payment.booking.status = BookingChoice.CONFIRMED
-                payment.paid = True
-                payment.status = PaymentChoice.COMPLETED
-                payment.booking.save()
-            else:
-                payment.paid = False
-                payment.status = PaymentChoice.FAILED
-        
-        payment.save()
+        try:
+            succeeded = get_gateway().verify(txn_ref)
+        except GatewayError:
+            return Response({'detail': 'Payment gateway unavailable'}, status=status.HTTP_502_BAD_GATEWAY)
+
+        if succeeded is not None:
+            payment.settle(succeeded)
+
         payment_info = PaymentSerializer(payment).data
-        return Response({'detail': 'Payment verification successful', 'payment': payment_info}, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({'detail': 'Payment verification successful', 'payment': payment_info}, status=status.HTTP_200_OK)
+
+
+def json_body(request):
+    """The request's JSON object, or None. Async views run without DRF's parsers."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return JsonResponse(data, status=status, encoder=JSONEncoder)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChapaInitiatePaymentView(View):
+    """
+    ChapaInitiatePaymentAPIView as a native async view. Under ASGI the gateway
+    round-trip is awaited on the pooled httpx client and queries go through
+    the async ORM, so one worker process keeps many payments in flight.
+    """
+    http_method_names = ['post']
+
+    async def post(self, request):
+        data = json_body(request)
+        if data is None:
+            return json_response({'detail': 'Expected a JSON object.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            booking = await Booking.objects.with_total_price().select_related('traveler').aget(booking_id=data.get('booking_id'))
+        except (Booking.DoesNotExist, DjangoValidationError):
+            return json_response({'detail': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        idempotency_key = request.headers.get('Idempotency-Key') or None
+        if idempotency_key:
+            previous = await Payment.objects.filter(idempotency_key=idempotency_key).afirst()
+            if previous is not None:
+                return self.replay(previous, booking)
+
+        if booking.status == BookingChoice.CONFIRMED:
+            return json_response(
+                {'detail': 'This booking has already been paid and confirmed.'},
+                status=status.HTTP_400_BAD_REQUEST
+                )
+
+        lock = f'chapa-initiate:{booking.pk}'
+        if not await cache.aadd(lock, idempotency_key or True, timeout=settings.PAYMENT_INITIATE_LOCK_TIMEOUT):
+            return json_response(
+                {'detail': 'A payment for this booking is already being initiated.'},
+                status=status.HTTP_409_CONFLICT
+                )
+        try:
+            if idempotency_key:
+                previous = await Payment.objects.filter(idempotency_key=idempotency_key).afirst()
+                if previous is not None:
+                    return self.replay(previous, booking)
+            return await self.initiate(request, booking, idempotency_key)
+        finally:
+            await cache.adelete(lock)
+
+    async def initiate(self, request, booking, idempotency_key):
+        txn_ref = str(uuid.uuid4())
+        callback_url = settings.CHAPA_CALLBACK_URL or request.build_absolute_uri(reverse('chapa-webhook'))
+        gateway = get_gateway()
+
+        try:
+            checkout_url = await gateway.ainitialize(booking, txn_ref, callback_url)
+        except GatewayError:
+            return json_response({'detail': 'Payment gateway unavailable'}, status=status.HTTP_502_BAD_GATEWAY)
+        except PaymentDeclined as exc:
+            return json_response({'detail': 'Payment Failed', 'error_response': exc.response}, status=status.HTTP_400_BAD_REQUEST)
+
+        payment = await sync_to_async(store_payment)(
+            booking=booking,
+            amount=booking.total_price.quantize(Decimal('0.01')),
+            gateway=gateway.name,
+            paid=False,
+            status=PaymentChoice.PENDING,
+            txn_ref=txn_ref,
+            idempotency_key=idempotency_key,
+            checkout_url=checkout_url
+        )
+        if payment is None:
+            return self.replay(await Payment.objects.aget(idempotency_key=idempotency_key), booking)
+        return self.initiated(payment)
+
+    def initiated(self, payment):
+        return json_response({
+            'detail': 'Payment Initiated',
+            'checkout_url': payment.checkout_url,
+            'payment': PaymentSerializer(payment).data
+        })
+
+    def replay(self, previous, booking):
+        if previous.booking_id != booking.pk:
+            return json_response(
+                {'detail': 'This Idempotency-Key was already used for another booking.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+        response = self.initiated(previous)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChapaPaymentVerifyView(View):
+    """ChapaPaymentVerifyAPIView as a native async view; see AsyncChapaInitiatePaymentView."""
+    http_method_names = ['post']
+
+    async def post(self, request):
+        data = json_body(request)
+        if data is None:
+            return json_response({'detail': 'Expected a JSON object.'}, status=status.HTTP_400_BAD_REQUEST)
+        txn_ref = data.get('txn_ref')
+        try:
+            payment = await Payment.objects.aget(txn_ref=txn_ref)
+        except Payment.DoesNotExist:
+            return json_response({'detail': 'Payment not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            succeeded = await get_gateway().averify(txn_ref)
+        except GatewayError:
+            return json_response({'detail': 'Payment gateway unavailable'}, status=status.HTTP_502_BAD_GATEWAY)
+
+        if succeeded is not None:
+            await sync_to_async(payment.settle)(succeeded)
+
+        payment_info = PaymentSerializer(payment).data
+        return json_response({'detail': 'Payment verification successful', 'payment': payment_info})
+
+
+class ChapaWebhookAPIView(APIView):
+    """The gateway pushes transaction events here; Chapa signs them with CHAPA_WEBHOOK_SECRET."""
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        gateway = get_gateway()
+        if not gateway.webhook_is_valid(request.body, request.headers):
+            return Response({'detail': 'Invalid signature'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        txn_ref, succeeded = gateway.webhook_event(request.data)
+        try:
+            payment = Payment.objects.select_related('booking').get(txn_ref=txn_ref)
+        except Payment.DoesNotExist:
+            return Response({'detail': 'Payment not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if succeeded is not None:
+            payment.settle(succeeded)
+        return Response({'detail': 'Received'}, status=status.HTTP_200_OK)